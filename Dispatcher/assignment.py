@@ -0,0 +1,174 @@
+"""Matching riders with drivers in batches
+
+assign() solves the assignment problem: given a matrix of costs, it pairs
+rows with columns so that the total cost is as low as possible. It uses the
+Hungarian algorithm, in the shortest augmenting path form that takes
+O(rows * rows * columns) time. travel_times() builds the matrix of travel
+times from a list of drivers to a list of locations.
+
+Both run on NumPy arrays if NumPy is installed, and on plain lists
+otherwise. The two give the same results. travel_times() only computes
+Manhattan distances on arrays, so it asks each driver for their travel times
+when the drivers have a distance model.
+"""
+
+from typing import List, Sequence, Tuple
+from driver import Driver
+from location import Location
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def travel_times(drivers: Sequence[Driver],
+                 locations: Sequence[Location]) -> List[List[int]]:
+    """Return a matrix with a row for each driver in <drivers> and a column
+    for each location in <locations>, holding the time it would take the
+    driver to drive to the location.
+
+    >>> drivers = [Driver("a", Location(0, 0), 1),
+    ...            Driver("b", Location(4, 4), 2)]
+    >>> times = travel_times(drivers, [Location(2, 2)])
+    >>> int(times[0][0]), int(times[1][0])
+    (4, 2)
+    """
+    if numpy is None or any(driver.model is not None for driver in drivers):
+        return [[driver.get_travel_time(location) for location in locations]
+                for driver in drivers]
+    rows = numpy.array([driver.location.m for driver in drivers])
+    columns = numpy.array([driver.location.n for driver in drivers])
+    speeds = numpy.array([driver.speed for driver in drivers])
+    to_rows = numpy.array([location.m for location in locations])
+    to_columns = numpy.array([location.n for location in locations])
+    distances = numpy.abs(rows[:, None] - to_rows[None, :]) \
+        + numpy.abs(columns[:, None] - to_columns[None, :])
+    return distances // speeds[:, None]
+
+
+def assign(costs: Sequence[Sequence[float]]) -> List[Tuple[int, int]]:
+    """Return the (row, column) pairs of a matching in <costs> with the
+    lowest total cost, in order of row.
+
+    If there are more rows than columns, some rows are left out; otherwise,
+    some columns are.
+
+    >>> assign([[4, 1, 3], [2, 0, 5], [3, 2, 2]])
+    [(0, 1), (1, 0), (2, 2)]
+    >>> assign([[1, 9], [2, 9], [3, 1]])
+    [(0, 0), (2, 1)]
+    """
+    if len(costs) == 0 or len(costs[0]) == 0:
+        return []
+    if len(costs) > len(costs[0]):
+        pairs = _hungarian(_transpose(costs))
+        return sorted((row, column) for column, row in pairs)
+    return _hungarian(costs)
+
+
+def _transpose(costs: Sequence[Sequence[float]]) -> Sequence[Sequence[float]]:
+    """Return <costs> with its rows and columns swapped.
+
+    """
+    if numpy is None:
+        return [list(column) for column in zip(*costs)]
+    return numpy.asarray(costs).T
+
+
+def _hungarian(costs: Sequence[Sequence[float]]) -> List[Tuple[int, int]]:
+    """Return the (row, column) pairs of a matching of every row in <costs>
+    with the lowest total cost, in order of row.
+
+    Precondition: <costs> has at least one row, and no more rows than
+    columns.
+    """
+    if numpy is not None:
+        return _hungarian_arrays(numpy.asarray(costs, dtype=float))
+    rows, columns = len(costs), len(costs[0])
+    infinity = float("inf")
+    # The potentials of the rows and columns. Row and column 0 are dummies,
+    # so costs[i - 1][j - 1] is the cost of row i and column j.
+    row_potential = [0] * (rows + 1)
+    column_potential = [0] * (columns + 1)
+    # match[j] is the row matched with column j, or 0 if there is none.
+    match = [0] * (columns + 1)
+    previous = [0] * (columns + 1)
+    for row in range(1, rows + 1):
+        match[0] = row
+        column = 0
+        slack = [infinity] * (columns + 1)
+        used = [False] * (columns + 1)
+        while match[column] != 0:
+            used[column] = True
+            current = match[column]
+            costs_row = costs[current - 1]
+            offset = row_potential[current]
+            delta = infinity
+            best = 0
+            for j in range(1, columns + 1):
+                if not used[j]:
+                    reduced = costs_row[j - 1] - offset - column_potential[j]
+                    if reduced < slack[j]:
+                        slack[j] = reduced
+                        previous[j] = column
+                    if slack[j] < delta:
+                        delta = slack[j]
+                        best = j
+            for j in range(columns + 1):
+                if used[j]:
+                    row_potential[match[j]] += delta
+                    column_potential[j] -= delta
+                else:
+                    slack[j] -= delta
+            column = best
+        while column != 0:
+            match[column] = match[previous[column]]
+            column = previous[column]
+    return sorted((match[j] - 1, j - 1) for j in range(1, columns + 1)
+                  if match[j] != 0)
+
+
+def _hungarian_arrays(costs: 'numpy.ndarray') -> List[Tuple[int, int]]:
+    """Return the same matching as _hungarian, with each step of the search
+    done on whole NumPy arrays of columns at once.
+
+    """
+    rows, columns = costs.shape
+    row_potential = numpy.zeros(rows + 1)
+    column_potential = numpy.zeros(columns + 1)
+    match = numpy.zeros(columns + 1, dtype=int)
+    previous = numpy.zeros(columns + 1, dtype=int)
+    padded = numpy.zeros((rows + 1, columns + 1))
+    padded[1:, 1:] = costs
+    for row in range(1, rows + 1):
+        match[0] = row
+        column = 0
+        slack = numpy.full(columns + 1, numpy.inf)
+        used = numpy.zeros(columns + 1, dtype=bool)
+        while match[column] != 0:
+            used[column] = True
+            current = match[column]
+            reduced = padded[current] - row_potential[current] \
+                - column_potential
+            better = ~used & (reduced < slack)
+            slack[better] = reduced[better]
+            previous[better] = column
+            free_slack = numpy.where(used, numpy.inf, slack)
+            best = int(numpy.argmin(free_slack[1:])) + 1
+            delta = free_slack[best]
+            row_potential[match[used]] += delta
+            column_potential[used] -= delta
+            slack[~used] -= delta
+            column = best
+        while column != 0:
+            match[column] = match[previous[column]]
+            column = previous[column]
+    return sorted((int(match[j]) - 1, j - 1) for j in range(1, columns + 1)
+                  if match[j] != 0)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['typing', 'driver',
+                                                  'location', 'numpy']})
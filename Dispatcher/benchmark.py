@@ -0,0 +1,526 @@
+"""Benchmarks for the simulation
+
+Run this module directly to time the simulation's hot paths, e.g.
+
+    python benchmark.py queue --sizes 1000 2000 5000
+    python benchmark.py memory
+    python benchmark.py parse --lines 1000000
+    python benchmark.py roads --grid 100
+    python benchmark.py pool --drivers 500
+
+The suite benchmark measures every hot path at fixed sizes. Save its results
+as a baseline, and later compare a run against that baseline to catch
+regressions:
+
+    python benchmark.py suite --save baseline.json
+    python benchmark.py suite --compare baseline.json --threshold 0.2
+
+Metrics whose names end in '_per_second' are better when higher. Metrics
+that count how often something happened, such as how many times each event
+type was handled, describe the workload rather than its speed: they are
+shown when comparing, but never count as regressions. Every other metric is
+a time or a size, and is better when lower.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+from container import Container, PriorityQueue, HeapPriorityQueue, \
+    CalendarQueue
+from dispatcher import Dispatcher
+from driver import Driver
+from event import Event, RiderRequest, DriverRequest, Cancellation, Pickup, \
+    Dropoff, EventPool, iter_events
+from fleet import ArrayIndex, GridIndex
+from location import DistanceModel, Location, deserialize_location, \
+    deserialize_locations
+from monitor import Activity, StreamingMonitor, REQUEST
+from profiling import Profiler
+from rider import Rider
+from roads import RoadNetwork
+from scenario import Scenario, generate, write_events
+from simulation import Simulation
+
+
+QUEUES = {
+    "sorted": PriorityQueue,
+    "heap": HeapPriorityQueue,
+    "calendar": CalendarQueue,
+}
+
+
+def _time(func: Callable[[], None]) -> float:
+    """Return the number of seconds it takes to call <func>.
+
+    """
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def _churn(queue: Container, timestamps: List[int], horizon: int) -> None:
+    """Load <queue> with events at <timestamps>, then drain it the way
+    Simulation.run does: every removed event schedules one follow-up event
+    up to <horizon> time units later, until the original events run out.
+
+    """
+    rng = random.Random(0)
+    queue.add_all(Event(timestamp) for timestamp in timestamps)
+    remaining = len(timestamps)
+    while not queue.is_empty():
+        event = queue.remove()
+        if remaining > 0:
+            queue.add(Event(event.timestamp + rng.randint(0, horizon)))
+            remaining -= 1
+
+
+def bench_queue(sizes: List[int],
+                horizon: int = 100) -> Dict[str, List[float]]:
+    """Return the seconds each queue in QUEUES takes to churn through each
+    number of events in <sizes>.
+
+    """
+    results = {}
+    for name, queue_class in QUEUES.items():
+        results[name] = []
+        for size in sizes:
+            rng = random.Random(size)
+            timestamps = sorted(rng.randint(0, size) for _ in range(size))
+            results[name].append(
+                _time(lambda: _churn(queue_class(), timestamps, horizon)))
+    return results
+
+
+def _footprint(factory: Callable[[int], object], n: int) -> float:
+    """Return the average number of bytes allocated by each of <n> calls to
+    <factory>, which is passed the number of the call.
+
+    Objects that <factory> returns are kept alive until all of them have
+    been made, and the list that holds them is not counted.
+    """
+    tracemalloc.start()
+    objects = [None] * n
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(n):
+        objects[i] = factory(i)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(objects)
+
+
+def bench_memory(n: int) -> Dict[str, float]:
+    """Return the average number of bytes taken by each kind of simulation
+    object, measured over <n> objects of each kind.
+
+    """
+    here = Location(1, 2)
+    there = Location(3, 4)
+    rider = Rider("rider", 10, here, there)
+    driver = Driver("driver", here, 1)
+    return {
+        "Location (distinct)": _footprint(
+            lambda i: Location(i // 1000 + 1000, i % 1000 + 1000), n),
+        "Location (100x100 grid)": _footprint(
+            lambda i: Location(i % 100, i // 100 % 100), n),
+        "Activity": _footprint(
+            lambda i: Activity(i, REQUEST, "rider", here), n),
+        "Rider": _footprint(lambda i: Rider("rider", i, here, there), n),
+        "Driver": _footprint(lambda i: Driver("driver", here, i), n),
+        "RiderRequest": _footprint(lambda i: RiderRequest(i, rider), n),
+        "DriverRequest": _footprint(lambda i: DriverRequest(i, driver), n),
+        "Cancellation": _footprint(lambda i: Cancellation(i, rider), n),
+        "Pickup": _footprint(lambda i: Pickup(i, rider, driver), n),
+        "Dropoff": _footprint(lambda i: Dropoff(i, rider, driver), n),
+    }
+
+
+def _scenario(events: int, grid: int) -> Scenario:
+    """Return a scenario with about <events> events on a <grid> by <grid>
+    grid, a tenth of which are driver requests.
+
+    """
+    duration = 1000
+    return Scenario(grid=grid, drivers=events // 10, duration=duration,
+                    rates=[(0, events * 0.9 / duration)])
+
+
+def bench_parse(lines: int, grid: int) -> Dict[str, float]:
+    """Return the lines per second at which an event file with about
+    <lines> random requests on a <grid> by <grid> grid is parsed, along
+    with the location tokens per second for the single and bulk location
+    parsers.
+
+    """
+    fd, filename = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        lines = write_events(_scenario(lines, grid), filename)
+        tokens = []
+        with open(filename) as file:
+            for line in file:
+                if not line.startswith("#"):
+                    tokens.extend(line.split()[3:-1])
+        results = {
+            "iter_events (lines/s)":
+                lines / _time(lambda: sum(1 for _ in iter_events(filename))),
+            "deserialize_location (tokens/s)": len(tokens) / _time(
+                lambda: [deserialize_location(token) for token in tokens]),
+            "deserialize_locations (tokens/s)": len(tokens) / _time(
+                lambda: deserialize_locations(tokens)),
+        }
+    finally:
+        os.remove(filename)
+    return results
+
+
+def bench_events(scenario: Scenario,
+                 model: Optional[DistanceModel] = None) -> Dict[str, float]:
+    """Simulate <scenario> and return the events per second, along with the
+    number of events of each class that were done and the mean microseconds
+    that their do() took.
+
+    model: The distance model for travel times, or None for Manhattan
+        distances.
+
+    The events per second are timed on a plain Simulation.run, streaming
+    the initial events, so they cover the same hot path as a real run. The
+    counts and times of each class come from a second, profiled run of the
+    same scenario, since profiling slows a run down.
+    """
+    initial = list(generate(scenario))
+    simulation = Simulation(dispatcher=Dispatcher(model=model))
+    elapsed = _time(lambda: simulation.run(iter(initial)))
+
+    profiler = Profiler()
+    Simulation(dispatcher=Dispatcher(model=model), profiler=profiler).run(
+        generate(scenario))
+    stats = {name[:-len(".do")]: stats
+             for name, stats in profiler.stats().items()
+             if name.endswith(".do")}
+
+    done = sum(stats[name]["calls"] for name in stats)
+    results = {"simulation.events_per_second": done / elapsed}
+    for name in sorted(stats):
+        results["do.{}.count".format(name)] = stats[name]["calls"]
+        results["do.{}.mean_us".format(name)] = stats[name]["mean_us"]
+    return results
+
+
+def bench_pooling(scenario: Scenario) -> Dict[str, float]:
+    """Simulate <scenario> with new event objects and then with pooled
+    ones, and return how long each run took in milliseconds, how many
+    garbage collections it set off, and its peak traced memory in
+    kilobytes.
+
+    The peak is measured in a separate run, since tracing slows the
+    simulation down.
+    """
+    results = {}
+    for mode in ("new", "pooled"):
+        def run() -> None:
+            """Simulate the scenario.
+
+            """
+            pool = EventPool() if mode == "pooled" else None
+            Simulation(monitor=StreamingMonitor(), pool=pool).run(
+                generate(scenario))
+
+        gc.collect()
+        before = sum(stats["collections"] for stats in gc.get_stats())
+        taken = _time(run)
+        after = sum(stats["collections"] for stats in gc.get_stats())
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results["pool.{}.run_ms".format(mode)] = taken * 1e3
+        results["pool.{}.gc_collections".format(mode)] = after - before
+        results["pool.{}.peak_kb".format(mode)] = peak / 1024
+    return results
+
+
+def bench_request_driver(fleet_sizes: List[int], grid: int,
+                         requests: int = 1000,
+                         index_class: type = GridIndex) -> Dict[str, float]:
+    """Return the mean microseconds that Dispatcher.request_driver takes for
+    a fleet of each size in <fleet_sizes>, all idle and spread over a <grid>
+    by <grid> grid, with the idle drivers kept in an <index_class>.
+
+    """
+    if index_class is GridIndex:
+        name = "request_driver.fleet_{}.mean_us"
+    else:
+        name = "request_driver." + index_class.__name__ + ".fleet_{}.mean_us"
+    results = {}
+    for size in fleet_sizes:
+        scenario = Scenario(grid=grid, drivers=size, duration=0, seed=size)
+        dispatcher = Dispatcher(index_class())
+        for event in generate(scenario):
+            dispatcher.request_rider(event.driver)
+        rng = random.Random(size)
+        riders = [Rider("r", 0, Location(rng.randrange(grid),
+                                         rng.randrange(grid)),
+                        Location(0, 0))
+                  for _ in range(requests)]
+        taken = _time(lambda: [dispatcher.request_driver(rider)
+                               for rider in riders])
+        results[name.format(size)] = taken / requests * 1e6
+    return results
+
+
+def bench_queue_depth(depths: List[int],
+                      operations: int = 10000) -> Dict[str, float]:
+    """Return the mean microseconds that each queue in QUEUES takes to add
+    and then remove an event while holding each number of events in
+    <depths>.
+
+    The sorted-list queue is skipped at depths over 1000, where it would
+    take minutes.
+    """
+    results = {}
+    for name, queue_class in QUEUES.items():
+        for depth in depths:
+            if name == "sorted" and depth > 1000:
+                continue
+            rng = random.Random(depth)
+            queue = queue_class()
+            queue.add_all(sorted((Event(rng.randrange(depth))
+                                  for _ in range(depth)),
+                                 key=lambda event: event.timestamp))
+            pending = [rng.randrange(depth) for _ in range(operations)]
+
+            def steady() -> None:
+                """Remove an event and add one later event, repeatedly.
+
+                """
+                for delay in pending:
+                    event = queue.remove()
+                    queue.add(Event(event.timestamp + delay))
+
+            results["queue.{}.depth_{}.mean_us".format(name, depth)] = \
+                _time(steady) / operations * 1e6
+    return results
+
+
+def _grid_roads(grid: int, cache_size: int = 65536) -> RoadNetwork:
+    """Return a road network with an intersection at every point of a <grid>
+    by <grid> grid, in which every fifth row and column is a fast road and
+    the streets between them take up to three times as long to drive.
+
+    """
+    rng = random.Random(grid)
+    roads = []
+    for m in range(grid):
+        for n in range(grid):
+            here = Location(m, n)
+            if m + 1 < grid:
+                roads.append((here, Location(m + 1, n),
+                              1 if n % 5 == 0 else rng.randint(1, 3)))
+            if n + 1 < grid:
+                roads.append((here, Location(m, n + 1),
+                              1 if m % 5 == 0 else rng.randint(1, 3)))
+    return RoadNetwork(roads, cache_size=cache_size)
+
+
+def bench_roads(grid: int, queries: int = 1000) -> Dict[str, float]:
+    """Return the mean microseconds that a road network over a <grid> by
+    <grid> grid takes to find the length of a route between random
+    locations, both when the route has to be searched for and when it is
+    cached.
+
+    """
+    rng = random.Random(grid)
+    pairs = [(Location(rng.randrange(grid), rng.randrange(grid)),
+              Location(rng.randrange(grid), rng.randrange(grid)))
+             for _ in range(queries)]
+    network = _grid_roads(grid)
+
+    def query() -> None:
+        """Find the length of the route between each pair.
+
+        """
+        for origin, destination in pairs:
+            network(origin, destination)
+
+    searched = _time(query)
+    cached = _time(query)
+    return {"roads.query.mean_us": searched / queries * 1e6,
+            "roads.cached_query.mean_us": cached / queries * 1e6}
+
+
+def peak_rss() -> Dict[str, float]:
+    """Return the peak resident set size of this process so far, in
+    kilobytes.
+
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak //= 1024
+    return {"memory.peak_rss_kb": peak}
+
+
+def bench_suite(quick: bool = False) -> Dict[str, float]:
+    """Run every benchmark at fixed sizes and return all of their metrics.
+
+    If <quick>, use smaller sizes.
+    """
+    scale = 1 if quick else 10
+    results = {}
+    results.update(bench_events(Scenario(grid=100, drivers=50 * scale,
+                                         duration=1000,
+                                         rates=[(0, 2.0 * scale)])))
+    fleet_sizes = [100, 1000, 10 * 1000 * scale]
+    results.update(bench_pooling(Scenario(grid=100, drivers=50 * scale,
+                                          duration=1000,
+                                          rates=[(0, 2.0 * scale)])))
+    results.update(bench_request_driver(fleet_sizes, 1000))
+    try:
+        results.update(bench_request_driver(fleet_sizes, 1000,
+                                            index_class=ArrayIndex))
+    except ImportError:
+        pass
+    results.update(bench_queue_depth([1000, 10000, 10000 * scale]))
+    results.update(bench_roads(10 * scale))
+    results.update(peak_rss())
+    return results
+
+
+# The endings of the names of metrics that are counts, not measurements.
+_COUNTS = (".count", ".gc_collections")
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float],
+            threshold: float) -> List[str]:
+    """Return the names of the metrics in <results> that are worse than in
+    <baseline> by more than the fraction <threshold>, after printing a
+    table of every metric that is in both. Counts are only shown.
+
+    >>> compare({"a.mean_us": 12, "b_per_second": 90, "c.count": 50},
+    ...         {"a.mean_us": 10, "b_per_second": 100, "c.count": 40}, 0.15)
+    ... # doctest: +NORMALIZE_WHITESPACE
+    metric        baseline     current  change
+    a.mean_us       10.000      12.000  +20.0%  REGRESSION
+    b_per_second   100.000      90.000  -10.0%
+    c.count         40.000      50.000  +25.0%  (count)
+    ['a.mean_us']
+    """
+    names = [name for name in results if name in baseline]
+    width = max([len("metric")] + [len(name) for name in names])
+    print("{:<{}} {:>11} {:>11}  change".format("metric", width, "baseline",
+                                                 "current"))
+    regressions = []
+    for name in names:
+        old, new = baseline[name], results[name]
+        change = (new - old) / old if old else 0.0
+        worse = -change if name.endswith("_per_second") else change
+        flag = ""
+        if name.endswith(_COUNTS):
+            flag = "  (count)"
+        elif worse > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:<{}} {:>11.3f} {:>11.3f} {:>+6.1%}{}".format(
+            name, width, old, new, change, flag))
+    return regressions
+
+
+def _print_table(title: str, sizes: List[int],
+                 results: Dict[str, List[float]]) -> None:
+    """Print <results> as a table with one row per entry of <sizes>.
+
+    """
+    names = list(results)
+    print(title)
+    print("{:>10}".format("n") + "".join("{:>12}".format(n) for n in names))
+    for i, size in enumerate(sizes):
+        print("{:>10}".format(size) + "".join(
+            "{:>11.4f}s".format(results[name][i]) for name in names))
+
+
+def main() -> None:
+    """Run the benchmarks named on the command line.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+    queue = sub.add_parser("queue", help="event queue add/remove churn")
+    queue.add_argument("--sizes", type=int, nargs="+",
+                       default=[1000, 2000, 5000])
+    queue.add_argument("--horizon", type=int, default=100)
+    memory = sub.add_parser("memory", help="bytes per simulation object")
+    memory.add_argument("-n", type=int, default=100000)
+    parse = sub.add_parser("parse", help="event file parsing throughput")
+    parse.add_argument("--lines", type=int, default=1000000)
+    parse.add_argument("--grid", type=int, default=1000)
+    pool = sub.add_parser("pool", help="new versus pooled event objects")
+    pool.add_argument("--drivers", type=int, default=500)
+    pool.add_argument("--duration", type=int, default=10000)
+    roads = sub.add_parser("roads", help="road network route lengths")
+    roads.add_argument("--grid", type=int, default=100)
+    suite = sub.add_parser("suite", help="every benchmark, for baselines")
+    suite.add_argument("--quick", action="store_true",
+                       help="use smaller sizes")
+    suite.add_argument("--save", metavar="FILE",
+                       help="save the results as a baseline")
+    suite.add_argument("--compare", metavar="FILE",
+                       help="compare the results with a saved baseline")
+    suite.add_argument("--threshold", type=float, default=0.1,
+                       help="the fraction by which a metric may get worse "
+                            "before it counts as a regression")
+    args = parser.parse_args()
+
+    if args.benchmark == "queue":
+        _print_table("Queue churn", args.sizes,
+                     bench_queue(args.sizes, args.horizon))
+    elif args.benchmark == "memory":
+        print("Bytes per object")
+        for name, size in bench_memory(args.n).items():
+            print("{:>24} {:>8.1f}".format(name, size))
+    elif args.benchmark == "parse":
+        print("Parsing throughput")
+        for name, rate in bench_parse(args.lines, args.grid).items():
+            print("{:>34} {:>12.0f}".format(name, rate))
+    elif args.benchmark == "pool":
+        print("Event pooling")
+        for name, value in bench_pooling(Scenario(
+                drivers=args.drivers, duration=args.duration,
+                rates=[(0, args.drivers / 25)])).items():
+            print("{:>34} {:>12.1f}".format(name, value))
+    elif args.benchmark == "roads":
+        print("Road network")
+        for name, taken in bench_roads(args.grid).items():
+            print("{:>34} {:>12.1f}".format(name, taken))
+        network = _grid_roads(args.grid)
+        rate = bench_events(Scenario(grid=args.grid, drivers=50), network)[
+            "simulation.events_per_second"]
+        print("{:>34} {:>12.0f}".format("simulation.events_per_second", rate))
+        print("{:>34} {:>12.3f}".format("cache.hit_rate",
+                                        network.cache.hit_rate()))
+    elif args.benchmark == "suite":
+        results = bench_suite(args.quick)
+        if args.save:
+            with open(args.save, "w") as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+        if args.compare:
+            with open(args.compare) as file:
+                baseline = json.load(file)
+            regressions = compare(results, baseline, args.threshold)
+            if regressions:
+                print("{} regression(s) over {:.0%}".format(
+                    len(regressions), args.threshold))
+                sys.exit(1)
+        elif not args.save:
+            for name, value in results.items():
+                print("{:<40} {:>14.3f}".format(name, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Checkpoint files
+
+A checkpoint file holds a snapshot of a running simulation: its event
+queue, its dispatcher with every registered driver and waiting rider, its
+monitor and how far it has got through its initial events. It is written
+with the highest pickle protocol after a short header:
+
+    header     magic b'SIMC' and format version
+    snapshot   the pickled object
+
+Drivers, riders, locations and events that are shared between parts of the
+simulation are stored once, and are shared again when the snapshot is
+loaded.
+"""
+
+import os
+import pickle
+import struct
+
+
+MAGIC = b'SIMC'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sH')
+
+
+def save(snapshot: object, filename: str) -> None:
+    """Write <snapshot> to the checkpoint file <filename>.
+
+    The file is written under a temporary name and then renamed, so a crash
+    while saving leaves any earlier checkpoint at <filename> intact.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "run.ckpt")
+    >>> save({"time": 60}, path)
+    >>> load(path)
+    {'time': 60}
+    """
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(_HEADER.pack(MAGIC, VERSION))
+        pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, filename)
+
+
+def load(filename: str) -> object:
+    """Return the snapshot in the checkpoint file <filename>.
+
+    Raise ValueError if the file is not a checkpoint file.
+    """
+    with open(filename, "rb") as file:
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size \
+                or _HEADER.unpack(header) != (MAGIC, VERSION):
+            raise ValueError("{} is not a version {} checkpoint file".format(
+                filename, VERSION))
+        return pickle.load(file)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['os', 'pickle', 'struct']})
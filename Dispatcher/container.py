@@ -1,4 +1,7 @@
 """Containers of objects"""
+from collections import deque
+from heapq import heapify, heappop, heappush
+from typing import Deque, Dict, Iterable, List, Set, Tuple
 
 
 class Container:
@@ -25,6 +28,36 @@ class Container:
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def peek(self) -> object:
+        """Return the item that remove() would return next, without removing
+        it.
+
+        Precondition: <self> should not be empty.
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def add_all(self, items: Iterable) -> None:
+        """Add every item in <items> to this Container, in order.
+
+        Subclasses may override this with a faster bulk insertion.
+        """
+        for item in items:
+            self.add(item)
+
+    def discard(self, item: object) -> None:
+        """Remove <item> itself from this Container, wherever it is, so that
+        it is never returned by remove() or peek().
+
+        Precondition: <item> is in this Container.
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def __len__(self) -> int:
+        """Return the number of items in this Container.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
 
 class PriorityQueue(Container):
     """A queue of items that operates in priority order.
@@ -77,6 +110,19 @@ class PriorityQueue(Container):
         """
         return self._items.pop(0)
 
+    def peek(self) -> object:
+        """Return the next item from this PriorityQueue without removing it.
+
+        Precondition: <self> should not be empty.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add("red")
+        >>> pq.add("blue")
+        >>> pq.peek()
+        'blue'
+        """
+        return self._items[0]
+
     def is_empty(self) -> bool:
         """
         Return true iff this PriorityQueue is empty.
@@ -105,7 +151,434 @@ class PriorityQueue(Container):
         self._items.append(item)
         self._items.sort()
 
+    def __len__(self) -> int:
+        """Return the number of items in this PriorityQueue.
+
+        """
+        return len(self._items)
+
+    def discard(self, item: object) -> None:
+        """Remove <item> itself from this PriorityQueue.
+
+        Precondition: <item> is in this PriorityQueue.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add_all(["red", "blue"])
+        >>> pq.discard("blue")
+        >>> pq.remove()
+        'red'
+        """
+        for i, other in enumerate(self._items):
+            if other is item:
+                del self._items[i]
+                return
+
+
+class HeapPriorityQueue(Container):
+    """A queue of items that operates in priority order, backed by a binary
+    heap.
+
+    This has the same behaviour as PriorityQueue, including FIFO resolution
+    of ties, but add and remove take O(log n) time instead of O(n log n) and
+    O(n) respectively.
+
+    Ties are resolved by pairing every item with an insertion sequence
+    number, so two items that compare equal are removed in the order they
+    were added.
+    """
+
+    # === Private Attributes ===
+    _items: List[Tuple[object, int]]
+    #     The items stored in the priority queue, each paired with the value
+    #     of _count when it was added.
+    _count: int
+    #     The number of items that have ever been added to this queue.
+    _discarded: Set[int]
+    #     The id() of each item in _items that has been discarded. Such an
+    #     item stays in the heap until it reaches the top, or until the heap
+    #     is compacted.
+    #
+    # === Representation Invariants ===
+    # _items is a binary min-heap, so _items[0] holds the item with the
+    # highest priority.
+    # _items[0] has not been discarded.
+    # Fewer than half of the items in _items have been discarded.
+
+    def __init__(self) -> None:
+        """Initialize an empty HeapPriorityQueue.
+
+        """
+        self._items = []
+        self._count = 0
+        self._discarded = set()
+
+    def remove(self) -> object:
+        """Remove and return the next item from this HeapPriorityQueue.
+
+        Precondition: <self> should not be empty.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.add("red")
+        >>> pq.add("blue")
+        >>> pq.add("yellow")
+        >>> pq.add("green")
+        >>> pq.remove()
+        'blue'
+        >>> pq.remove()
+        'green'
+        >>> pq.remove()
+        'red'
+        >>> pq.remove()
+        'yellow'
+        """
+        item = heappop(self._items)[0]
+        if self._discarded:
+            self._drop_discarded()
+        return item
+
+    def peek(self) -> object:
+        """Return the next item from this HeapPriorityQueue without removing
+        it.
+
+        Precondition: <self> should not be empty.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.add("red")
+        >>> pq.add("blue")
+        >>> pq.peek()
+        'blue'
+        """
+        return self._items[0][0]
+
+    def is_empty(self) -> bool:
+        """
+        Return true iff this HeapPriorityQueue is empty.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.is_empty()
+        True
+        >>> pq.add("thing")
+        >>> pq.is_empty()
+        False
+        """
+        return len(self._items) == 0
+
+    def __len__(self) -> int:
+        """Return the number of items in this HeapPriorityQueue, not counting
+        those that have been discarded.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.add_all(["red", "blue", "green"])
+        >>> pq.discard("green")
+        >>> len(pq)
+        2
+        """
+        return len(self._items) - len(self._discarded)
+
+    def discard(self, item: object) -> None:
+        """Remove <item> itself from this HeapPriorityQueue.
+
+        This takes O(1) time: <item> is only marked, and is dropped without
+        being returned once it reaches the top of the heap. When half of the
+        heap has been discarded, it is rebuilt without those items.
+
+        Precondition: <item> is in this HeapPriorityQueue.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.add_all(["red", "blue", "green"])
+        >>> pq.discard("blue")
+        >>> pq.remove()
+        'green'
+        """
+        self._discarded.add(id(item))
+        if 2 * len(self._discarded) >= len(self._items):
+            self._items = [entry for entry in self._items
+                           if id(entry[0]) not in self._discarded]
+            heapify(self._items)
+            self._discarded.clear()
+        else:
+            self._drop_discarded()
+
+    def __getstate__(self) -> Dict[str, object]:
+        """Return the state of this queue for pickling, without the items
+        that have been discarded. They are recorded by id(), which does not
+        survive pickling.
+
+        """
+        state = dict(self.__dict__)
+        if self._discarded:
+            state["_items"] = [entry for entry in self._items
+                               if id(entry[0]) not in self._discarded]
+            heapify(state["_items"])
+            state["_discarded"] = set()
+        return state
+
+    def _drop_discarded(self) -> None:
+        """Pop the discarded items from the top of the heap.
+
+        """
+        items = self._items
+        while items and id(items[0][0]) in self._discarded:
+            self._discarded.remove(id(heappop(items)[0]))
+
+    def add(self, item: object) -> None:
+        """Add <item> to this HeapPriorityQueue.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.add("yellow")
+        >>> pq.add("blue")
+        >>> pq.remove()
+        'blue'
+        """
+        heappush(self._items, (item, self._count))
+        self._count += 1
+
+    def add_all(self, items: Iterable) -> None:
+        """Add every item in <items> to this HeapPriorityQueue, in order.
+
+        The heap is rebuilt once in O(n) time rather than sifting each item
+        in separately.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.add_all(["yellow", "blue", "red", "blue"])
+        >>> [pq.remove() for _ in range(4)]
+        ['blue', 'blue', 'red', 'yellow']
+        """
+        for item in items:
+            self._items.append((item, self._count))
+            self._count += 1
+        heapify(self._items)
+
+
+class CalendarQueue(Container):
+    """A queue of timestamped items that operates in timestamp order, backed
+    by a calendar queue (a timing wheel).
+
+    Every item must have a non-negative integer <timestamp> attribute, and
+    items with older timestamps are removed first. Ties are resolved in FIFO
+    order, as in PriorityQueue.
+
+    The wheel has one bucket for each of the next <width> timestamps, so an
+    item that is due within that window is added and removed in O(1) time.
+    Items further in the future wait in an overflow heap and are moved onto
+    the wheel as it turns.
+
+    Precondition: unless the queue is empty, an item is never added with a
+    timestamp older than that of the last item removed. This always holds
+    for the events of a simulation.
+    """
+
+    # === Private Attributes ===
+    _width: int
+    #     The number of buckets on the wheel.
+    _buckets: List[Deque[object]]
+    #     The wheel. The bucket at index t % _width holds the items with
+    #     timestamp t, in the order they were added.
+    _now: int
+    #     The timestamp of the earliest bucket on the wheel. This is the
+    #     timestamp of the last item removed, if any.
+    _cursor: int
+    #     A timestamp no later than that of any item on the wheel. peek()
+    #     moves this forward past empty buckets; unlike _now, that does not
+    #     stop earlier items from being added.
+    _size: int
+    #     The number of items on the wheel.
+    _overflow: List[Tuple[int, int, object]]
+    #     A heap of (timestamp, sequence number, item) for the items that are
+    #     due too far in the future to fit on the wheel.
+    _count: int
+    #     The number of items that have ever been added to _overflow.
+    _discarded: Set[int]
+    #     The id() of each item in _overflow that has been discarded. Such
+    #     an item is dropped when it would have been moved onto the wheel.
+    #
+    # === Representation Invariants ===
+    # Every item on the wheel has a timestamp t with
+    # _now <= _cursor <= t < _now + _width.
+    # Every item in _overflow has a timestamp t with t >= _now + _width.
+    # _overflow[0] has not been discarded.
+
+    def __init__(self, width: int = 1024) -> None:
+        """Initialize an empty CalendarQueue whose wheel has <width> buckets.
+
+        Precondition: width > 0.
+        """
+        self._width = width
+        self._buckets = [deque() for _ in range(width)]
+        self._now = 0
+        self._cursor = 0
+        self._size = 0
+        self._overflow = []
+        self._count = 0
+        self._discarded = set()
+
+    def remove(self) -> object:
+        """Remove and return the item with the oldest timestamp.
+
+        Precondition: <self> should not be empty.
+
+        >>> from event import Event
+        >>> cq = CalendarQueue(4)
+        >>> cq.add_all([Event(9), Event(2), Event(5)])
+        >>> [cq.remove().timestamp for _ in range(3)]
+        [2, 5, 9]
+        """
+        if self._size == 0:
+            # Nothing is due within the wheel's window, so jump straight to
+            # the earliest overflow item instead of turning bucket by bucket.
+            self._now = self._cursor = self._overflow[0][0]
+            self._refill()
+        item = self.peek()
+        self._buckets[self._cursor % self._width].popleft()
+        self._size -= 1
+        if self._cursor > self._now:
+            self._now = self._cursor
+            self._refill()
+        return item
+
+    def peek(self) -> object:
+        """Return the item with the oldest timestamp without removing it.
+
+        Precondition: <self> should not be empty.
+
+        >>> from event import Event
+        >>> cq = CalendarQueue(4)
+        >>> cq.add_all([Event(9), Event(5)])
+        >>> cq.peek().timestamp
+        5
+        >>> cq.add(Event(3))
+        >>> cq.peek().timestamp
+        3
+        """
+        if self._size == 0:
+            return self._overflow[0][2]
+        bucket = self._buckets[self._cursor % self._width]
+        while not bucket:
+            self._cursor += 1
+            bucket = self._buckets[self._cursor % self._width]
+        return bucket[0]
+
+    def is_empty(self) -> bool:
+        """
+        Return true iff this CalendarQueue is empty.
+
+        >>> from event import Event
+        >>> cq = CalendarQueue()
+        >>> cq.is_empty()
+        True
+        >>> cq.add(Event(3))
+        >>> cq.is_empty()
+        False
+        """
+        return self._size == 0 and not self._overflow
+
+    def __len__(self) -> int:
+        """Return the number of items in this CalendarQueue, not counting
+        those that have been discarded.
+
+        """
+        return self._size + len(self._overflow) - len(self._discarded)
+
+    def discard(self, item: object) -> None:
+        """Remove <item> itself from this CalendarQueue.
+
+        An item on the wheel is removed from its bucket straight away, which
+        only takes time in proportion to the number of items with the same
+        timestamp. An item in the overflow heap is only marked, and is
+        dropped when the wheel reaches it, or when half of the overflow heap
+        has been discarded and it is rebuilt without those items.
+
+        Precondition: <item> is in this CalendarQueue.
+
+        >>> from event import Event
+        >>> cq = CalendarQueue(4)
+        >>> soon, later = Event(1), Event(20)
+        >>> cq.add_all([soon, later, Event(2)])
+        >>> cq.discard(soon)
+        >>> cq.discard(later)
+        >>> cq.remove().timestamp, cq.is_empty()
+        (2, True)
+        """
+        timestamp = item.timestamp
+        if timestamp < self._now + self._width:
+            bucket = self._buckets[timestamp % self._width]
+            for i, other in enumerate(bucket):
+                if other is item:
+                    del bucket[i]
+                    self._size -= 1
+                    return
+        self._discarded.add(id(item))
+        if 2 * len(self._discarded) >= len(self._overflow):
+            self._overflow = [entry for entry in self._overflow
+                              if id(entry[2]) not in self._discarded]
+            heapify(self._overflow)
+            self._discarded.clear()
+        else:
+            self._drop_discarded()
+
+    def __getstate__(self) -> Dict[str, object]:
+        """Return the state of this queue for pickling, without the items
+        that have been discarded. They are recorded by id(), which does not
+        survive pickling.
+
+        """
+        state = dict(self.__dict__)
+        if self._discarded:
+            state["_overflow"] = [entry for entry in self._overflow
+                                  if id(entry[2]) not in self._discarded]
+            heapify(state["_overflow"])
+            state["_discarded"] = set()
+        return state
+
+    def _drop_discarded(self) -> None:
+        """Pop the discarded items from the top of the overflow heap.
+
+        """
+        overflow = self._overflow
+        while overflow and id(overflow[0][2]) in self._discarded:
+            self._discarded.remove(id(heappop(overflow)[2]))
+
+    def add(self, item: object) -> None:
+        """Add <item> to this CalendarQueue.
+
+        >>> from event import Event
+        >>> cq = CalendarQueue(2)
+        >>> first, second = Event(7), Event(7)
+        >>> cq.add(Event(8))
+        >>> cq.add(first)
+        >>> cq.add(second)
+        >>> cq.remove() is first
+        True
+        >>> cq.remove() is second
+        True
+        """
+        timestamp = item.timestamp
+        if timestamp < self._now and self.is_empty():
+            self._now = timestamp
+        if timestamp < self._now + self._width:
+            self._buckets[timestamp % self._width].append(item)
+            self._size += 1
+            if timestamp < self._cursor:
+                self._cursor = timestamp
+        else:
+            heappush(self._overflow, (timestamp, self._count, item))
+            self._count += 1
+
+    def _refill(self) -> None:
+        """Move the overflow items that are now within the wheel's window
+        onto the wheel.
+
+        """
+        limit = self._now + self._width
+        while self._overflow and self._overflow[0][0] < limit:
+            timestamp, _, item = heappop(self._overflow)
+            self._buckets[timestamp % self._width].append(item)
+            self._size += 1
+            if self._discarded:
+                self._drop_discarded()
+
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all()
+    python_ta.check_all(config={'extra-imports': ['collections', 'heapq',
+                                                  'typing']})
@@ -1,7 +1,11 @@
 """Dispatcher for the simulation"""
 
-from typing import Optional, List
+from collections import OrderedDict
+from typing import List, Optional, Set, Tuple
+from assignment import assign, travel_times
 from driver import Driver
+from fleet import FleetIndex, GridIndex
+from location import DistanceModel
 from rider import Rider
 
 
@@ -19,19 +23,53 @@ class Dispatcher:
     the dispatcher does nothing. Once a driver requests a rider, the driver
     is registered with the dispatcher, and will be used to fulfill future
     rider requests.
+
+    A batch dispatcher does not assign anyone when they make a request.
+    Every rider waits, and every idle driver stays idle, until match() is
+    called, usually once all the requests with the same timestamp have been
+    made. It then assigns riders to drivers all at once, so that the total
+    time that the drivers take to reach their riders is as low as possible.
+
+    === Attributes ===
+    drivers: The registered drivers.
+    waiting_list: The riders waiting for a driver, keyed by rider id, in the
+        order they started waiting.
+    batch: Whether this is a batch dispatcher.
+    model: The distance model that every registered driver's travel times
+        are computed with, or None for Manhattan distances.
     """
 
-    drivers: List[Driver]
-    waiting_list: list
+    drivers: Set[Driver]
+    waiting_list: OrderedDict
+    batch: bool
+    model: Optional[DistanceModel]
+
+    # === Private Attributes ===
+    _idle: FleetIndex
+    #     The registered drivers that are idle, indexed by location.
 
-    def __init__(self) -> None:
+    def __init__(self, index: Optional[FleetIndex] = None,
+                 batch: bool = False,
+                 model: Optional[DistanceModel] = None) -> None:
         """Initialize a Dispatcher.
 
+        index: An empty index to keep the idle drivers in. A GridIndex is
+            used if this is None.
+        batch: Whether this is a batch dispatcher.
+        model: The distance model for travel times, such as a
+            roads.RoadNetwork. Distances are Manhattan distances if this is
+            None.
         """
 
-        self.drivers = []
+        self.drivers = set()
 
-        self.waiting_list = []
+        self.waiting_list = OrderedDict()
+
+        if index is None:
+            index = GridIndex()
+        self._idle = index
+        self.batch = batch
+        self.model = model
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -43,47 +81,98 @@ class Dispatcher:
         """Return a driver for the rider, or None if no driver is available.
 
         Add the rider to the waiting list if there is no available driver.
+        A batch dispatcher always adds the rider to the waiting list.
 
         """
-
-        if len(self.drivers) == 0:
-            self.waiting_list.append(rider)
+        if self.batch:
+            self.waiting_list[rider.id] = rider
             return None
 
-        fastest = self.drivers[0]
-
-        for driver in self.drivers:
-            if driver.is_idle is True:
-                curr = driver.get_travel_time(rider.origin)
-                if curr < fastest.get_travel_time(rider.origin):
-                    fastest = driver
-        return fastest
+        driver = self._idle.nearest(rider.origin)
+        if driver is None:
+            self.waiting_list[rider.id] = rider
+        return driver
 
     def request_rider(self, driver: Driver) -> Optional[Rider]:
         """Return a rider for the driver, or None if no rider is available.
 
         If this is a new driver, register the driver for future rider requests.
+        A batch dispatcher always returns None.
 
         """
 
         if driver not in self.drivers:
-            self.drivers.append(driver)
-        if len(self.waiting_list) == 0:
+            self.drivers.add(driver)
+            driver.model = self.model
+            self._idle.add(driver)
+        if self.batch or len(self.waiting_list) == 0:
             return None
 
-        rider = self.waiting_list[0]
-
-        self.waiting_list.remove(self.waiting_list[0])
-        return rider
+        return self.waiting_list.popitem(last=False)[1]
 
     def cancel_ride(self, rider: Rider) -> None:
         """Cancel the ride for rider.
 
         """
-        if rider in self.waiting_list:
-            self.waiting_list.remove(rider)
+        self.waiting_list.pop(rider.id, None)
+
+    def match(self) -> List[Tuple[Rider, Driver]]:
+        """Return the pairs of waiting riders and idle drivers that should
+        be assigned to each other, and take those riders off the waiting
+        list.
+
+        As many riders as possible are assigned, and among the ways of doing
+        that, the one in which the drivers' total travel time to their
+        riders is lowest is chosen. When several ways are equally good, the
+        one chosen depends only on the order the riders started waiting and
+        the drivers' ranks in the index, not on the kind of index. The pairs
+        are in the order that the riders started waiting. The caller must
+        start each driver driving to their rider.
+
+        >>> from location import Location
+        >>> dispatcher = Dispatcher(batch=True)
+        >>> for i, m in enumerate([0, 4]):
+        ...     _ = dispatcher.request_rider(Driver(str(i), Location(m, 0), 1))
+        >>> near = Rider("near", 5, Location(3, 0), Location(9, 9))
+        >>> far = Rider("far", 5, Location(0, 0), Location(9, 9))
+        >>> dispatcher.request_driver(near) is None
+        True
+        >>> dispatcher.request_driver(far) is None
+        True
+        >>> [(rider.id, driver.id) for rider, driver in dispatcher.match()]
+        [('near', '1'), ('far', '0')]
+        """
+        riders = list(self.waiting_list.values())
+        count = min(len(riders), len(self._idle))
+        if count == 0:
+            return []
+        if len(riders) * count >= len(self._idle):
+            drivers = list(self._idle)
+        else:
+            # Each rider's driver in the best assignment is among the
+            # <count> nearest to them, so no other driver needs to be
+            # considered.
+            candidates = {}
+            for rider in riders:
+                for driver in self._idle.nearby(rider.origin, count):
+                    candidates[driver] = None
+            drivers = list(candidates)
+        # The assignment found among equally good ones depends on the order
+        # of the drivers, so put them in a fixed order.
+        drivers.sort(key=self._idle.rank)
+        pairs = assign(travel_times(drivers, [rider.origin
+                                              for rider in riders]))
+        matches = []
+        for row, column in sorted(pairs, key=lambda pair: pair[1]):
+            rider = riders[column]
+            del self.waiting_list[rider.id]
+            matches.append((rider, drivers[row]))
+        return matches
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all(config={'extra-imports': ['typing', 'driver', 'rider']})
+    python_ta.check_all(config={'extra-imports': ['typing', 'collections',
+                                                  'assignment', 'driver',
+                                                  'fleet', 'location',
+                                                  'rider']})
@@ -1,8 +1,12 @@
 """Drivers for the simulation"""
-from typing import Optional
-from location import Location, manhattan_distance
+from __future__ import annotations
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+from location import DistanceModel, Location, distance
 from rider import Rider
 
+if TYPE_CHECKING:
+    from fleet import FleetIndex
+
 
 class Driver:
     """A driver for a ride-sharing service.
@@ -13,13 +17,23 @@ class Driver:
     is_idle: True if the driver is idle and False otherwise.
     Speed: Speed of the drivers car
     Destination: Destination for the driver, none if driver has no destination
+    index: The index of idle drivers that this driver keeps up to date, or
+        None if the driver has not been added to one.
+    model: The distance model that travel times are computed with, or None
+        for Manhattan distances. A dispatcher sets it to its own when it
+        registers the driver.
     """
 
+    __slots__ = ('id', 'location', 'is_idle', 'speed', 'destination', 'index',
+                 'model')
+
     id: str
     location: Location
     is_idle: bool
     speed: int
     destination: Optional[Location]
+    index: Optional[FleetIndex]
+    model: Optional[DistanceModel]
 
     def __init__(self, identifier: str, location: Location, speed: int) -> None:
         """Initialize a Driver.
@@ -30,6 +44,8 @@ class Driver:
         self.is_idle = True
         self.speed = speed
         self.destination = None
+        self.index = None
+        self.model = None
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -48,13 +64,40 @@ class Driver:
 
         return s_id == o_id and s_speed == o_speed
 
+    def __hash__(self) -> int:
+        """Return a hash of this driver, consistent with __eq__.
+
+        >>> first = Driver("a", Location(0, 0), 1)
+        >>> hash(first) == hash(Driver("a", Location(3, 4), 1))
+        True
+        """
+        return hash((self.id, self.speed))
+
+    def __reduce__(self) -> Tuple[type, Tuple[str, Location, int],
+                                  Tuple[None, Dict[str, object]]]:
+        """Return the information needed to pickle this driver.
+
+        The id and speed are passed to the constructor, so that the driver
+        can be hashed as soon as it is unpickled, even while the index that
+        holds it is still being unpickled. The rest is restored afterwards.
+
+        >>> import pickle
+        >>> driver = Driver("a", Location(1, 2), 3)
+        >>> copy = pickle.loads(pickle.dumps(driver))
+        >>> copy == driver, copy.location is driver.location
+        (True, True)
+        """
+        return Driver, (self.id, self.location, self.speed), \
+            (None, {"is_idle": self.is_idle, "destination": self.destination,
+                    "index": self.index, "model": self.model})
+
     def get_travel_time(self, destination: Location) -> int:
         """Return the time it will take to arrive at the destination,
         rounded to the nearest integer.
 
         """
 
-        dist = manhattan_distance(self.location, destination)
+        dist = distance(self.location, destination, self.model)
         return round(dist // self.speed)
 
     def start_drive(self, location: Location) -> int:
@@ -62,8 +105,8 @@ class Driver:
         Return the time that the drive will take.
 
         """
-        self.is_idle = False
         self.destination = location
+        self._set_idle(False)
         return self.get_travel_time(self.destination)
 
     def end_drive(self) -> None:
@@ -73,17 +116,16 @@ class Driver:
 
         """
 
-        self.is_idle = True
         self.location, self.destination = self.destination, None
+        self._set_idle(True)
 
     def start_ride(self, rider: Rider) -> int:
         """Start a ride and return the time the ride will take.
 
         """
 
-        self.is_idle = False
-
         self.destination = rider.destination
+        self._set_idle(False)
         return self.get_travel_time(self.destination)
 
     def end_ride(self) -> None:
@@ -94,12 +136,19 @@ class Driver:
 
         """
 
-        self.is_idle = True
-
         self.location, self.destination = self.destination, None
+        self._set_idle(True)
+
+    def _set_idle(self, is_idle: bool) -> None:
+        """Set whether this driver is idle, and update its index.
+
+        """
+        self.is_idle = is_idle
+        if self.index is not None:
+            self.index.update(self)
 
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(
-        config={'extra-imports': ['location', 'rider']})
+        config={'extra-imports': ['typing', 'location', 'rider', 'fleet']})
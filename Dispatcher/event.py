@@ -4,7 +4,7 @@ This file should contain all of the classes necessary to model the different
 kinds of events in the simulation.
 """
 from __future__ import annotations
-from typing import List
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from rider import Rider, WAITING, CANCELLED, SATISFIED
 from dispatcher import Dispatcher
 from driver import Driver
@@ -31,6 +31,8 @@ class Event:
     timestamp: A timestamp for this event.
     """
 
+    __slots__ = ('timestamp',)
+
     timestamp: int
 
     def __init__(self, timestamp: int) -> None:
@@ -147,9 +149,28 @@ class Event:
         Note: the "business logic" of what actually happens should not be
         handled in any Event classes.
 
+        """
+        events = []
+        self.do_into(dispatcher, monitor, events.append, _UNPOOLED)
+        return events
+
+    def do_into(self, dispatcher: Dispatcher, monitor: Monitor,
+                schedule: Callable[[Event], None], pool: EventPool) -> None:
+        """Do this Event, as do() does, but take each new event from <pool>
+        and pass it to <schedule> as soon as it is spawned, instead of
+        returning a list of them.
+
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def stale_events(self) -> List[Event]:
+        """Return the events that have already been scheduled but that this
+        event, once done, has made pointless. They should be taken out of
+        the event queue without being done.
+
+        """
+        return []
+
 
 class RiderRequest(Event):
     """A rider requests a driver.
@@ -158,6 +179,8 @@ class RiderRequest(Event):
     rider: The rider.
     """
 
+    __slots__ = ('rider',)
+
     rider: Rider
 
     def __init__(self, timestamp: int, rider: Rider) -> None:
@@ -167,27 +190,29 @@ class RiderRequest(Event):
         super().__init__(timestamp)
         self.rider = rider
 
-    def do(self, dispatcher: Dispatcher, monitor: Monitor) -> List[Event]:
+    def do_into(self, dispatcher: Dispatcher, monitor: Monitor,
+                schedule: Callable[[Event], None], pool: EventPool) -> None:
         """Assign the rider to a driver or add the rider to a waiting list.
         If the rider is assigned to a driver, the driver starts driving to
         the rider.
 
-        Return a Cancellation event. If the rider is assigned to a driver,
-        also return a Pickup event.
+        Schedule a Cancellation event. If the rider is assigned to a driver,
+        first schedule a Pickup event.
 
         """
         monitor.notify(self.timestamp, RIDER, REQUEST,
                        self.rider.id, self.rider.origin)
 
-        events = []
         driver = dispatcher.request_driver(self.rider)
         if driver is not None:
             travel_time = driver.start_drive(self.rider.origin)
-            events.append(Pickup(self.timestamp + travel_time,
-                                 self.rider, driver))
-        events.append(Cancellation(self.timestamp + self.rider.patience,
-                                   self.rider))
-        return events
+            schedule(pool.take(Pickup, self.timestamp + travel_time,
+                               self.rider, driver))
+        cancellation = pool.take(Cancellation,
+                                 self.timestamp + self.rider.patience,
+                                 self.rider)
+        self.rider.cancellation = cancellation
+        schedule(cancellation)
 
     def __str__(self) -> str:
         """Return a string representation of this event.
@@ -203,6 +228,8 @@ class DriverRequest(Event):
     driver: The driver.
     """
 
+    __slots__ = ('driver',)
+
     driver: Driver
 
     def __init__(self, timestamp: int, driver: Driver) -> None:
@@ -212,11 +239,12 @@ class DriverRequest(Event):
         super().__init__(timestamp)
         self.driver = driver
 
-    def do(self, dispatcher: Dispatcher, monitor: Monitor) -> List[Event]:
+    def do_into(self, dispatcher: Dispatcher, monitor: Monitor,
+                schedule: Callable[[Event], None], pool: EventPool) -> None:
         """Register the driver, if this is the first request, and
         assign a rider to the driver, if one is available.
 
-        If a rider is available, return a Pickup event.
+        If a rider is available, schedule a Pickup event.
 
         """
         # Notify the monitor about the request.
@@ -227,13 +255,11 @@ class DriverRequest(Event):
         # arrives at the riders location.
         monitor.notify(self.timestamp, DRIVER, REQUEST,
                        self.driver.id, self.driver.location)
-        events = []
         rider = dispatcher.request_rider(self.driver)
         if rider is not None:
             travel_time = self.driver.start_drive(rider.origin)
-            events.append(Pickup(self.timestamp + travel_time,
-                                 rider, self.driver))
-        return events
+            schedule(pool.take(Pickup, self.timestamp + travel_time,
+                               rider, self.driver))
 
     def __str__(self) -> str:
         """Return a string representation of this event.
@@ -248,6 +274,8 @@ class Cancellation(Event):
     === Attributes ===
     rider: The rider.
     """
+    __slots__ = ('rider',)
+
     rider: Rider
 
     def __init__(self, timestamp: int, rider: Rider) -> None:
@@ -257,12 +285,14 @@ class Cancellation(Event):
         super().__init__(timestamp)
         self.rider = rider
 
-    def do(self, dispatcher: Dispatcher, monitor: Monitor) -> None:
+    def do_into(self, dispatcher: Dispatcher, monitor: Monitor,
+                schedule: Callable[[Event], None], pool: EventPool) -> None:
 
         monitor.notify(self.timestamp, RIDER, CANCEL, self.rider.id,
                        self.rider.origin)
         dispatcher.cancel_ride(self.rider)
         self.rider.status = CANCELLED
+        self.rider.cancellation = None
 
     def __str__(self) -> str:
         """Return a string representation of this event.
@@ -278,6 +308,8 @@ class Pickup(Event):
         rider: The rider.
         driver: the driver
         """
+    __slots__ = ('rider', 'driver')
+
     rider: Rider
     driver: Driver
 
@@ -289,10 +321,10 @@ class Pickup(Event):
         self.rider = rider
         self.driver = driver
 
-    def do(self, dispatcher: Dispatcher, monitor: Monitor) -> List[Event]:
+    def do_into(self, dispatcher: Dispatcher, monitor: Monitor,
+                schedule: Callable[[Event], None], pool: EventPool) -> None:
         monitor.notify(self.timestamp, DRIVER, PICKUP,
                        self.driver.id, self.driver.destination)
-        events = []
         self.driver.end_drive()
 
         if self.rider.status == WAITING:
@@ -301,12 +333,22 @@ class Pickup(Event):
             self.rider.status = SATISFIED
             self.driver.start_ride(self.rider)
             travel_time = self.driver.start_ride(self.rider)
-            events.append(Dropoff(self.timestamp + travel_time, self.rider,
-                                  self.driver))
+            schedule(pool.take(Dropoff, self.timestamp + travel_time,
+                               self.rider, self.driver))
 
         else:
-            events.append(DriverRequest(self.timestamp, self.driver))
-        return events
+            schedule(pool.take(DriverRequest, self.timestamp, self.driver))
+
+    def stale_events(self) -> List[Event]:
+        """Return the rider's Cancellation if the rider has been picked up,
+        since they can no longer cancel.
+
+        """
+        cancellation = self.rider.cancellation
+        if cancellation is None or self.rider.status != SATISFIED:
+            return []
+        self.rider.cancellation = None
+        return [cancellation]
 
     def __str__(self) -> str:
         """Return a string representation of this event.
@@ -322,6 +364,8 @@ class Dropoff(Event):
     rider: The rider.
     driver: the driver
     """
+    __slots__ = ('rider', 'driver')
+
     rider: Rider
     driver: Driver
 
@@ -333,13 +377,12 @@ class Dropoff(Event):
         self.rider = rider
         self.driver = driver
 
-    def do(self, dispatcher: Dispatcher, monitor: Monitor) -> List[Event]:
+    def do_into(self, dispatcher: Dispatcher, monitor: Monitor,
+                schedule: Callable[[Event], None], pool: EventPool) -> None:
         monitor.notify(self.timestamp, DRIVER, DROPOFF,
                        self.driver.id, self.driver.destination)
-        events = []
         self.driver.end_ride()
-        events.append(DriverRequest(self.timestamp, self.driver))
-        return events
+        schedule(pool.take(DriverRequest, self.timestamp, self.driver))
 
     def __str__(self) -> str:
         """Return a string representation of this event.
@@ -348,6 +391,85 @@ class Dropoff(Event):
         return "{} -- {}: DropOff".format(self.timestamp, self.rider)
 
 
+class EventPool:
+    """A free list of Pickup, Dropoff, DriverRequest and Cancellation events
+    that have been done, to be reused as new events instead of allocating
+    new objects.
+
+    An event must only be released once nothing refers to it any more: not
+    the event queue, not a rider's cancellation and not its creator. In
+    particular, an event that was discarded from a HeapPriorityQueue is
+    still in the queue until it reaches the front, so it must not be
+    released.
+
+    >>> pool = EventPool()
+    >>> first = pool.take(DriverRequest, 3, Driver("Almond", None, 1))
+    >>> pool.release(first)
+    >>> second = pool.take(DriverRequest, 5, Driver("Basil", None, 1))
+    >>> second is first, str(second)
+    (True, '5 -- Basil: Request a rider')
+    """
+
+    # === Private Attributes ===
+    _free: Dict[type, List[Event]]
+    #     The released events of each class that can be reused.
+
+    def __init__(self) -> None:
+        """Initialize an EventPool with no free events.
+
+        """
+        self._free = {Pickup: [], Dropoff: [], DriverRequest: [],
+                      Cancellation: []}
+
+    def __reduce__(self) -> Tuple[type, Tuple]:
+        """Return the information needed to pickle this pool. Free events
+        are not kept.
+
+        """
+        return EventPool, ()
+
+    def take(self, cls: type, timestamp: int, *args: object) -> Event:
+        """Return an event of class <cls> initialized with <timestamp> and
+        <args>, reusing a released one if there is one.
+
+        """
+        free = self._free.get(cls)
+        if free:
+            event = free.pop()
+            event.__init__(timestamp, *args)
+            return event
+        return cls(timestamp, *args)
+
+    def release(self, event: Event) -> None:
+        """Make <event>, which has been done, available for reuse, if it is
+        of a class that this pool reuses.
+
+        """
+        free = self._free.get(type(event))
+        if free is not None:
+            free.append(event)
+
+
+# The pool that do() takes new events from. Nothing is ever released into it,
+# so every event it gives out is new.
+_UNPOOLED = EventPool()
+
+
+def start_pickups(timestamp: int,
+                  matches: List[Tuple[Rider, Driver]]) -> List[Event]:
+    """Start each driver in <matches> driving to their rider at <timestamp>,
+    and return a Pickup event for each of them.
+
+    This is how the riders and drivers matched by a batch dispatcher are
+    assigned to each other.
+    """
+    events = []
+    for rider, driver in matches:
+        travel_time = driver.start_drive(rider.origin)
+        events.append(Pickup(timestamp + travel_time, rider, driver))
+    return events
+
+
 def create_event_list(filename: str) -> List[Event]:
     """Return a list of Events based on raw list of events in <filename>.
 
@@ -356,52 +478,76 @@ def create_event_list(filename: str) -> List[Event]:
 
     filename: The name of a file that contains the list of events.
     """
-    events = []
-    event = None
+    return list(iter_events(filename))
+
+
+def iter_events(filename: str) -> Iterator[Event]:
+    """Yield the Events in <filename> one at a time, reading the file only
+    as far as is needed to produce the next event.
+
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout.
+
+    filename: The name of a file that contains the list of events.
+
+    >>> [str(event) for event in iter_events("events.txt")][:2]
+    ['0 -- Amaranth: Request a rider', '0 -- Bergamot: Request a rider']
+    """
     with open(filename, "r") as file:
         for line in file:
-            line = line.strip()
-
-            if not line or line.startswith("#"):
-                # Skip lines that are blank or start with #.
-                continue
-
-            # Create a list of words in the line, e.g.
-            # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
-            # Note that these are strings, and you'll need to convert some
-            # of them to a different type.
-            tokens = line.split()
-            timestamp = int(tokens[0])
-            event_type = tokens[1]
-
-            # HINT: Use Location.deserialize to convert the location string to
-            # a location.
-
-            if event_type == "DriverRequest":
-
-                # Create a DriverRequest event.
-                location = deserialize_location(tokens[3])
-                speed = int(tokens[4])
-                driver = Driver(tokens[2], location, speed)
-                event = DriverRequest(timestamp, driver)
-            elif event_type == "RiderRequest":
-
-                # Create a RiderRequest event.
-                origin = deserialize_location(tokens[3])
-                destination = deserialize_location(tokens[4])
-                patience = int(tokens[5])
-                rider = Rider(tokens[2], patience, origin, destination)
-                event = RiderRequest(timestamp, rider)
+            event = parse_event(line)
             if event is not None:
-                events.append(event)
+                yield event
 
-    return events
+
+def parse_event(line: str) -> Optional[Event]:
+    """Return the Event described by one <line> of an event file, or None
+    if the line is blank or a comment.
+
+    >>> str(parse_event("10 RiderRequest Cerise 4,2 1,5 15"))
+    '10 -- Cerise: Request a driver'
+    >>> parse_event("# a comment") is None
+    True
+    """
+    line = line.strip()
+
+    if not line or line.startswith("#"):
+        # Skip lines that are blank or start with #.
+        return None
+
+    # Create a list of words in the line, e.g.
+    # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
+    # Note that these are strings, and you'll need to convert some
+    # of them to a different type.
+    tokens = line.split()
+    timestamp = int(tokens[0])
+    event_type = tokens[1]
+
+    # HINT: Use Location.deserialize to convert the location string to
+    # a location.
+
+    if event_type == "DriverRequest":
+
+        # Create a DriverRequest event.
+        location = deserialize_location(tokens[3])
+        speed = int(tokens[4])
+        driver = Driver(tokens[2], location, speed)
+        return DriverRequest(timestamp, driver)
+    if event_type == "RiderRequest":
+
+        # Create a RiderRequest event.
+        origin = deserialize_location(tokens[3])
+        destination = deserialize_location(tokens[4])
+        patience = int(tokens[5])
+        rider = Rider(tokens[2], patience, origin, destination)
+        return RiderRequest(timestamp, rider)
+    return None
 
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(
         config={
-            'allowed-io': ['create_event_list'],
+            'allowed-io': ['iter_events'],
             'extra-imports': ['rider', 'dispatcher', 'driver',
                               'location', 'monitor']})
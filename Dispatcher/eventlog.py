@@ -0,0 +1,242 @@
+"""Binary event logs
+
+An event log holds the same DriverRequest and RiderRequest events as a text
+event file, in a compact binary format that can be loaded without parsing:
+
+    header     magic b'EVLG', format version, record count, and the offsets
+               of the string and location tables
+    records    one fixed-width record per event, in file order
+    strings    every driver and rider id, each stored once
+    locations  every location, each stored once as a row and a column
+
+Each record holds the event's timestamp and kind, the index of its driver or
+rider id in the string table, the indexes of two locations in the location
+table and one more integer: for a DriverRequest these are the driver's
+location (the second location is unused) and speed, and for a RiderRequest
+they are the rider's origin, destination and patience.
+
+Run this module to convert a text event file:
+
+    python eventlog.py events.txt events.bin
+"""
+
+from __future__ import annotations
+import argparse
+import mmap
+import struct
+from typing import Dict, Iterator, List, Optional
+from driver import Driver
+from event import Event, DriverRequest, RiderRequest, iter_events
+from location import Location
+from rider import Rider
+
+
+MAGIC = b'EVLG'
+VERSION = 1
+
+DRIVER_REQUEST = 0
+RIDER_REQUEST = 1
+
+_HEADER = struct.Struct('<4sH2xQQQ')
+_RECORD = struct.Struct('<qIIIiB')
+_LENGTH = struct.Struct('<I')
+_LOCATION = struct.Struct('<ii')
+
+
+def convert(text_filename: str, log_filename: str) -> int:
+    """Write the events in the text event file <text_filename> to a new
+    event log at <log_filename>, and return the number of events written.
+
+    """
+    ids: Dict[str, int] = {}
+    locations: Dict[Location, int] = {}
+    count = 0
+    with open(log_filename, "wb") as file:
+        file.write(_HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+        for event in iter_events(text_filename):
+            file.write(_pack(event, ids, locations))
+            count += 1
+        strings_offset = file.tell()
+        file.write(_LENGTH.pack(len(ids)))
+        for identifier in ids:
+            data = identifier.encode("utf-8")
+            file.write(_LENGTH.pack(len(data)))
+            file.write(data)
+        locations_offset = file.tell()
+        file.write(_LENGTH.pack(len(locations)))
+        for location in locations:
+            file.write(_LOCATION.pack(location.m, location.n))
+        file.seek(0)
+        file.write(_HEADER.pack(MAGIC, VERSION, count, strings_offset,
+                                locations_offset))
+    return count
+
+
+def _pack(event: Event, ids: Dict[str, int],
+          locations: Dict[Location, int]) -> bytes:
+    """Return the record for <event>, adding its id to <ids> and its
+    locations to <locations> if necessary.
+
+    """
+    if isinstance(event, DriverRequest):
+        driver = event.driver
+        return _RECORD.pack(event.timestamp,
+                            ids.setdefault(driver.id, len(ids)),
+                            locations.setdefault(driver.location,
+                                                 len(locations)),
+                            0, driver.speed, DRIVER_REQUEST)
+    rider = event.rider
+    return _RECORD.pack(event.timestamp, ids.setdefault(rider.id, len(ids)),
+                        locations.setdefault(rider.origin, len(locations)),
+                        locations.setdefault(rider.destination,
+                                             len(locations)),
+                        rider.patience, RIDER_REQUEST)
+
+
+class EventLog:
+    """An event log that has been opened for reading.
+
+    The file is memory-mapped, and each event is only constructed when it is
+    asked for, so opening even a very large log is cheap. Events can be
+    looked up by position or iterated over in file order, which means an
+    EventLog can be passed straight to Simulation.run.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "events.bin")
+    >>> convert("events.txt", path)
+    12
+    >>> with EventLog(path) as log:
+    ...     print(len(log), log[0], log[6], sep="\\n")
+    12
+    0 -- Amaranth: Request a rider
+    0 -- Almond: Request a driver
+    """
+
+    # === Private Attributes ===
+    _file: object
+    #     The open log file.
+    _map: mmap.mmap
+    #     A read-only memory map of the whole log file.
+    _count: int
+    #     The number of events in the log.
+    _ids: List[str]
+    #     The string table of driver and rider ids.
+    _locations: List[Optional[Location]]
+    #     The location table. Each location is only created the first time a
+    #     record refers to it, and is None until then.
+    _locations_offset: int
+    #     The position in the file of the first row and column in the
+    #     location table.
+
+    def __init__(self, filename: str) -> None:
+        """Open the event log at <filename>.
+
+        Raise ValueError if the file is not an event log.
+        """
+        self._file = open(filename, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count, offset, self._locations_offset = \
+            _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{} is not a version {} event log".format(
+                filename, VERSION))
+        self._ids = []
+        (count,) = _LENGTH.unpack_from(self._map, offset)
+        offset += _LENGTH.size
+        for _ in range(count):
+            (length,) = _LENGTH.unpack_from(self._map, offset)
+            offset += _LENGTH.size
+            self._ids.append(
+                self._map[offset:offset + length].decode("utf-8"))
+            offset += length
+        (count,) = _LENGTH.unpack_from(self._map, self._locations_offset)
+        self._locations_offset += _LENGTH.size
+        self._locations = [None] * count
+
+    def __len__(self) -> int:
+        """Return the number of events in this log.
+
+        """
+        return self._count
+
+    def __getitem__(self, index: int) -> Event:
+        """Return a new Event for the record at position <index>.
+
+        """
+        if not 0 <= index < self._count:
+            raise IndexError("event log index out of range")
+        return self._unpack(_HEADER.size + index * _RECORD.size)
+
+    def __iter__(self) -> Iterator[Event]:
+        """Yield a new Event for each record, in file order.
+
+        """
+        unpack = self._unpack
+        for offset in range(_HEADER.size,
+                            _HEADER.size + self._count * _RECORD.size,
+                            _RECORD.size):
+            yield unpack(offset)
+
+    def __enter__(self) -> EventLog:
+        """Return this log, to be closed when the with statement ends.
+
+        """
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close this log.
+
+        """
+        self.close()
+
+    def close(self) -> None:
+        """Close this log. No more events may be read from it.
+
+        """
+        self._map.close()
+        self._file.close()
+
+    def _unpack(self, offset: int) -> Event:
+        """Return a new Event for the record that starts at <offset>.
+
+        """
+        timestamp, index, first, second, value, kind = \
+            _RECORD.unpack_from(self._map, offset)
+        locations = self._locations
+        origin = locations[first] or self._location(first)
+        if kind == DRIVER_REQUEST:
+            driver = Driver(self._ids[index], origin, value)
+            return DriverRequest(timestamp, driver)
+        destination = locations[second] or self._location(second)
+        rider = Rider(self._ids[index], value, origin, destination)
+        return RiderRequest(timestamp, rider)
+
+    def _location(self, index: int) -> Location:
+        """Return the location at position <index> in the location table.
+
+        """
+        location = self._locations[index]
+        if location is None:
+            location = Location(*_LOCATION.unpack_from(
+                self._map, self._locations_offset + index * _LOCATION.size))
+            self._locations[index] = location
+        return location
+
+
+def main() -> None:
+    """Convert the text event file named on the command line to an event
+    log.
+
+    """
+    parser = argparse.ArgumentParser(description="Convert a text event file "
+                                                 "to a binary event log.")
+    parser.add_argument("events", help="the text event file to read")
+    parser.add_argument("log", help="the event log to write")
+    args = parser.parse_args()
+    print("Wrote {} events to {}".format(convert(args.events, args.log),
+                                         args.log))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,514 @@
+"""Indexes of the idle drivers in a fleet"""
+
+from __future__ import annotations
+import heapq
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from driver import Driver
+from location import Location
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FleetIndex:
+    """An index of the idle drivers in a fleet, which finds the ones that
+    can get to a location the soonest.
+
+    Drivers are added to the index once, when they are registered, and the
+    index is then kept up to date by the drivers themselves: a driver calls
+    update() whenever it becomes idle or busy.
+
+    This is an abstract class.  Only child classes should be instantiated.
+    """
+
+    def __len__(self) -> int:
+        """Return the number of idle drivers in this index.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def __iter__(self) -> Iterator[Driver]:
+        """Yield the idle drivers in this index.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def __contains__(self, driver: Driver) -> bool:
+        """Return True iff <driver> is an idle driver in this index.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def add(self, driver: Driver) -> None:
+        """Add <driver> to this index, and have it keep the index up to date
+        from now on. Drivers are ranked in the order they are added.
+
+        Precondition: <driver> has not been added to an index before.
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def rank(self, driver: Driver) -> int:
+        """Return the rank of <driver>, by which ties in travel time are
+        broken.
+
+        Precondition: <driver> has been added to this index.
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def update(self, driver: Driver) -> None:
+        """Record the current location and idleness of <driver>.
+
+        Precondition: <driver> has been added to this index.
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def nearest(self, location: Location) -> Optional[Driver]:
+        """Return the idle driver that can get to <location> the soonest, or
+        None if there is no idle driver.
+
+        Ties are broken in favour of the driver with the lowest rank.
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def nearby(self, location: Location, count: int) -> List[Driver]:
+        """Return the <count> idle drivers that can get to <location> the
+        soonest, soonest first, or every idle driver if there are fewer.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+
+class GridIndex(FleetIndex):
+    """An index of idle drivers, bucketed by their location on the grid.
+
+    Drivers are added to the index once, when they are registered, and the
+    index is then kept up to date by the drivers themselves: a driver calls
+    update() whenever it becomes idle or busy. Only idle drivers are stored.
+
+    nearest() finds the idle driver with the shortest travel time to a
+    location by searching outwards from that location one ring of buckets at
+    a time, and stops as soon as no driver in a further ring could arrive
+    sooner than the best driver found so far.
+    """
+
+    # === Private Attributes ===
+    _cell_size: int
+    #     The width and height of each bucket, in grid units.
+    _buckets: Dict[Tuple[int, int], Set[Driver]]
+    #     The idle drivers in each non-empty bucket.
+    _where: Dict[Driver, Tuple[int, int]]
+    #     The bucket that each idle driver is in. The keys of this dictionary
+    #     are the set of idle drivers.
+    _ranks: Dict[Driver, int]
+    #     The order in which every driver was added. Ties in travel time go
+    #     to the driver that was added first.
+    _max_speed: int
+    #     The speed of the fastest driver that has been added.
+    _bounds: Optional[Tuple[int, int, int, int]]
+    #     The lowest row, highest row, lowest column and highest column of
+    #     every bucket that has held a driver, or None if none has.
+    #
+    # === Representation Invariants ===
+    # A driver is in _where iff it is idle, and then it is in exactly one
+    # bucket: the one that contains its location.
+    # No bucket in _buckets is empty.
+
+    def __init__(self, cell_size: int = 8) -> None:
+        """Initialize an empty GridIndex with buckets <cell_size> units wide.
+
+        Precondition: cell_size > 0.
+        """
+        self._cell_size = cell_size
+        self._buckets = {}
+        self._where = {}
+        self._ranks = {}
+        self._max_speed = 0
+        self._bounds = None
+
+    def __len__(self) -> int:
+        """Return the number of idle drivers in this index.
+
+        """
+        return len(self._where)
+
+    def __iter__(self) -> Iterator[Driver]:
+        """Yield the idle drivers in this index, in no particular order.
+
+        """
+        return iter(self._where)
+
+    def __contains__(self, driver: Driver) -> bool:
+        """Return True iff <driver> is an idle driver in this index.
+
+        """
+        return driver in self._where
+
+    def add(self, driver: Driver) -> None:
+        """Add <driver> to this index, and have it keep the index up to date
+        from now on. Drivers are ranked in the order they are added.
+
+        Precondition: <driver> has not been added to an index before.
+        """
+        self._ranks[driver] = len(self._ranks)
+        self._max_speed = max(self._max_speed, driver.speed)
+        driver.index = self
+        self.update(driver)
+
+    def rank(self, driver: Driver) -> int:
+        """Return the rank of <driver>, by which ties in travel time are
+        broken.
+
+        Precondition: <driver> has been added to this index.
+        """
+        return self._ranks[driver]
+
+    def update(self, driver: Driver) -> None:
+        """Record the current location and idleness of <driver>.
+
+        Precondition: <driver> has been added to this index.
+        """
+        key = self._where.pop(driver, None)
+        if key is not None:
+            bucket = self._buckets[key]
+            bucket.discard(driver)
+            if not bucket:
+                del self._buckets[key]
+        if driver.is_idle:
+            key = self._bucket_of(driver.location)
+            self._buckets.setdefault(key, set()).add(driver)
+            self._where[driver] = key
+            self._extend_bounds(key)
+
+    def nearest(self, location: Location) -> Optional[Driver]:
+        """Return the idle driver that can get to <location> the soonest, or
+        None if there is no idle driver.
+
+        Ties are broken in favour of the driver that was added first.
+
+        >>> index = GridIndex(2)
+        >>> slow = Driver("slow", Location(0, 1), 1)
+        >>> fast = Driver("fast", Location(9, 9), 9)
+        >>> index.add(slow)
+        >>> index.add(fast)
+        >>> index.nearest(Location(5, 5)).id
+        'fast'
+        >>> fast.start_drive(Location(1, 1))
+        1
+        >>> index.nearest(Location(5, 5)).id
+        'slow'
+        """
+        if not self._where:
+            return None
+        row, column = self._bucket_of(location)
+        lowest_row, highest_row, lowest_column, highest_column = self._bounds
+        last_ring = max(row - lowest_row, highest_row - row,
+                        column - lowest_column, highest_column - column)
+
+        best = None
+        best_key = None
+        ring = 0
+        while ring <= last_ring:
+            if best_key is not None and ring > 0:
+                # Every location in this ring is at least this far away.
+                distance = (ring - 1) * self._cell_size + 1
+                if distance // self._max_speed > best_key[0]:
+                    break
+            if 8 * ring > len(self._buckets):
+                # The ring has more buckets than there are non-empty ones,
+                # so it is cheaper to check the rest of the buckets directly.
+                keys = [key for key in self._buckets
+                        if max(abs(key[0] - row),
+                               abs(key[1] - column)) >= ring]
+                ring = last_ring
+            else:
+                keys = _ring(row, column, ring)
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    continue
+                for driver in bucket:
+                    driver_key = (driver.get_travel_time(location),
+                                  self._ranks[driver])
+                    if best_key is None or driver_key < best_key:
+                        best, best_key = driver, driver_key
+            ring += 1
+        return best
+
+    def nearby(self, location: Location, count: int) -> List[Driver]:
+        """Return the <count> idle drivers that can get to <location> the
+        soonest, soonest first, or every idle driver if there are fewer.
+
+        Ties are broken in favour of the driver that was added first, so
+        the first driver returned is the one nearest() returns.
+
+        >>> index = GridIndex(2)
+        >>> for i in range(4):
+        ...     index.add(Driver(str(i), Location(3 * i, 0), 1))
+        >>> [driver.id for driver in index.nearby(Location(4, 0), 3)]
+        ['1', '2', '0']
+        """
+        if not self._where or count <= 0:
+            return []
+        row, column = self._bucket_of(location)
+        lowest_row, highest_row, lowest_column, highest_column = self._bounds
+        last_ring = max(row - lowest_row, highest_row - row,
+                        column - lowest_column, highest_column - column)
+
+        # The best drivers so far, as a heap whose root is the worst of them.
+        best = []
+        ring = 0
+        while ring <= last_ring:
+            if len(best) == count and ring > 0:
+                distance = (ring - 1) * self._cell_size + 1
+                if distance // self._max_speed > -best[0][0]:
+                    break
+            if 8 * ring > len(self._buckets):
+                keys = [key for key in self._buckets
+                        if max(abs(key[0] - row),
+                               abs(key[1] - column)) >= ring]
+                ring = last_ring
+            else:
+                keys = _ring(row, column, ring)
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    continue
+                for driver in bucket:
+                    entry = (-driver.get_travel_time(location),
+                             -self._ranks[driver], driver)
+                    if len(best) < count:
+                        heapq.heappush(best, entry)
+                    elif entry[:2] > best[0][:2]:
+                        heapq.heapreplace(best, entry)
+            ring += 1
+        return [entry[2] for entry in sorted(best, reverse=True)]
+
+    def _bucket_of(self, location: Location) -> Tuple[int, int]:
+        """Return the bucket that contains <location>.
+
+        """
+        return location.m // self._cell_size, location.n // self._cell_size
+
+    def _extend_bounds(self, key: Tuple[int, int]) -> None:
+        """Grow _bounds to include the bucket <key>.
+
+        """
+        if self._bounds is None:
+            self._bounds = (key[0], key[0], key[1], key[1])
+        else:
+            lowest_row, highest_row, lowest_column, highest_column = \
+                self._bounds
+            self._bounds = (min(lowest_row, key[0]), max(highest_row, key[0]),
+                            min(lowest_column, key[1]),
+                            max(highest_column, key[1]))
+
+
+class ArrayIndex(FleetIndex):
+    """An index of idle drivers that keeps the fleet in NumPy arrays, and
+    can be used in place of a GridIndex.
+
+    The row, column, speed and idleness of every driver that has been added
+    are kept in parallel arrays, one slot per driver, and are updated
+    whenever the driver calls update(). nearest() computes the travel time
+    of the whole fleet with a few array operations, and picks the idle
+    driver with the shortest one, rather than looking at drivers one by
+    one. Its results are the same as those of a GridIndex. When a driver has
+    a distance model, the travel times are asked of each driver instead.
+
+    ArrayIndex needs NumPy.
+
+    >>> index = ArrayIndex()
+    >>> index.add(Driver("slow", Location(0, 1), 1))
+    >>> index.add(Driver("fast", Location(9, 9), 9))
+    >>> index.nearest(Location(5, 5)).id
+    'fast'
+    """
+
+    # === Private Attributes ===
+    _drivers: List[Driver]
+    #     Every driver that has been added, in the order of their slots.
+    _slots: Dict[Driver, int]
+    #     The slot of every driver that has been added.
+    _rows: numpy.ndarray
+    #     The row of each driver's location when they last became idle.
+    _columns: numpy.ndarray
+    #     The column of each driver's location when they last became idle.
+    _speeds: numpy.ndarray
+    #     The speed of each driver.
+    _idle: numpy.ndarray
+    #     Whether each driver is idle.
+    _count: int
+    #     The number of idle drivers.
+    _modelled: bool
+    #     Whether any driver that has been added has a distance model.
+    #
+    # === Representation Invariants ===
+    # Only the first len(_drivers) slots of each array are in use; the
+    # arrays are all the same length, which is at least that.
+
+    def __init__(self, capacity: int = 64) -> None:
+        """Initialize an empty ArrayIndex with room for <capacity> drivers
+        before its arrays have to grow.
+
+        Raise ImportError if NumPy is not installed.
+
+        Precondition: capacity > 0.
+        """
+        if numpy is None:
+            raise ImportError("ArrayIndex needs NumPy")
+        self._drivers = []
+        self._slots = {}
+        self._rows = numpy.zeros(capacity, dtype=numpy.int64)
+        self._columns = numpy.zeros(capacity, dtype=numpy.int64)
+        self._speeds = numpy.ones(capacity, dtype=numpy.int64)
+        self._idle = numpy.zeros(capacity, dtype=bool)
+        self._count = 0
+        self._modelled = False
+
+    def __len__(self) -> int:
+        """Return the number of idle drivers in this index.
+
+        """
+        return self._count
+
+    def __iter__(self) -> Iterator[Driver]:
+        """Yield the idle drivers in this index, in the order they were
+        added.
+
+        """
+        size = len(self._drivers)
+        return (self._drivers[slot]
+                for slot in numpy.flatnonzero(self._idle[:size]))
+
+    def __contains__(self, driver: Driver) -> bool:
+        """Return True iff <driver> is an idle driver in this index.
+
+        """
+        slot = self._slots.get(driver)
+        return slot is not None and bool(self._idle[slot])
+
+    def add(self, driver: Driver) -> None:
+        """Add <driver> to this index, and have it keep the index up to date
+        from now on. Drivers are ranked in the order they are added.
+
+        Precondition: <driver> has not been added to an index before.
+        """
+        slot = len(self._drivers)
+        if slot == len(self._idle):
+            self._grow()
+        self._drivers.append(driver)
+        self._slots[driver] = slot
+        self._speeds[slot] = driver.speed
+        if driver.model is not None:
+            self._modelled = True
+        driver.index = self
+        self.update(driver)
+
+    def rank(self, driver: Driver) -> int:
+        """Return the rank of <driver>, by which ties in travel time are
+        broken.
+
+        Precondition: <driver> has been added to this index.
+        """
+        return self._slots[driver]
+
+    def update(self, driver: Driver) -> None:
+        """Record the current location and idleness of <driver>.
+
+        Precondition: <driver> has been added to this index.
+        """
+        slot = self._slots[driver]
+        if driver.is_idle:
+            self._rows[slot] = driver.location.m
+            self._columns[slot] = driver.location.n
+        if driver.is_idle != self._idle[slot]:
+            self._count += 1 if driver.is_idle else -1
+            self._idle[slot] = driver.is_idle
+
+    def nearest(self, location: Location) -> Optional[Driver]:
+        """Return the idle driver that can get to <location> the soonest, or
+        None if there is no idle driver.
+
+        Ties are broken in favour of the driver that was added first.
+        """
+        if self._count == 0:
+            return None
+        times = self._travel_times(location)
+        # Slots are in the order the drivers were added, so the first slot
+        # with the shortest time breaks any tie.
+        return self._drivers[int(numpy.argmin(times))]
+
+    def nearby(self, location: Location, count: int) -> List[Driver]:
+        """Return the <count> idle drivers that can get to <location> the
+        soonest, soonest first, or every idle driver if there are fewer.
+
+        Ties are broken in favour of the driver that was added first.
+
+        >>> index = ArrayIndex()
+        >>> for i in range(4):
+        ...     index.add(Driver(str(i), Location(3 * i, 0), 1))
+        >>> [driver.id for driver in index.nearby(Location(4, 0), 3)]
+        ['1', '2', '0']
+        """
+        count = min(count, self._count)
+        if count <= 0:
+            return []
+        times = self._travel_times(location)
+        order = numpy.argsort(times, kind="stable")[:count]
+        return [self._drivers[slot] for slot in order]
+
+    def _travel_times(self, location: Location) -> numpy.ndarray:
+        """Return the travel time of every driver to <location>, as
+        Driver.get_travel_time computes it, with the travel time of every
+        driver that is not idle replaced by the largest possible time.
+
+        """
+        size = len(self._drivers)
+        idle = self._idle[:size]
+        if self._modelled:
+            times = numpy.full(size, numpy.iinfo(numpy.int64).max)
+            for slot in numpy.flatnonzero(idle):
+                times[slot] = self._drivers[slot].get_travel_time(location)
+            return times
+        times = (numpy.abs(self._rows[:size] - location.m)
+                 + numpy.abs(self._columns[:size] - location.n)) \
+            // self._speeds[:size]
+        times[~idle] = numpy.iinfo(numpy.int64).max
+        return times
+
+    def _grow(self) -> None:
+        """Double the length of the arrays.
+
+        """
+        for name in ("_rows", "_columns", "_speeds", "_idle"):
+            array = getattr(self, name)
+            grown = numpy.zeros(2 * len(array), dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+
+def _ring(row: int, column: int, ring: int) -> Iterator[Tuple[int, int]]:
+    """Yield the buckets whose Chebyshev distance from bucket (row, column)
+    is exactly <ring>.
+
+    >>> sorted(_ring(0, 0, 1))
+    [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+    """
+    if ring == 0:
+        yield row, column
+        return
+    for c in range(column - ring, column + ring + 1):
+        yield row - ring, c
+        yield row + ring, c
+    for r in range(row - ring + 1, row + ring):
+        yield r, column - ring
+        yield r, column + ring
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={'extra-imports': ['heapq', 'typing', 'driver', 'location',
+                                  'numpy']})
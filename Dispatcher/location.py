@@ -1,18 +1,78 @@
-"""Locations for the simulation"""
+"""Locations for the simulation
+
+Distances between locations are Manhattan distances on an open grid, unless
+a distance model is given. A distance model is any function of an origin and
+a destination that returns a whole distance, such as a roads.RoadNetwork. A
+simulation's model is held by its dispatcher, which hands it to every driver
+it registers and, through the simulation, to the monitor, so travel times
+and the monitor's report are computed alike; simulations with different
+models can run side by side. A model that is slow to compute can be wrapped
+in a DistanceCache, which remembers the distances between the origins and
+destinations that were asked for most recently.
+"""
 
 from __future__ import annotations
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 
 class Location:
-    """A two-dimensional location."""
+    """A two-dimensional location.
+
+    Locations are immutable and interned: there is only ever one Location
+    object for each point, so creating a location that already exists
+    returns the existing object.
+
+    === Attributes ===
+    m: The row of this location.
+    n: The column of this location.
+
+    >>> Location(1, 2) is Location(1, 2)
+    True
+    """
+
+    __slots__ = ('m', 'n')
+
+    m: int
+    n: int
+
+    # === Private Attributes ===
+    _interned: Dict[int, Dict[int, Location]] = {}
+    #     Every location that has been created, keyed by row and then by
+    #     column. Nesting the tables avoids storing a (row, column) tuple
+    #     for every location.
 
-    def __init__(self, row: int, column: int) -> None:
-        """Initialize a location.
+    def __new__(cls, row: int, column: int) -> Location:
+        """Return the location at <row>, <column>, creating it if this is
+        the first request for that point.
 
         """
-        # TODO
-        self.m = row
-        self.n = column
+        columns = cls._interned.get(row)
+        if columns is None:
+            columns = cls._interned[row] = {}
+        location = columns.get(column)
+        if location is None:
+            location = super().__new__(cls)
+            object.__setattr__(location, 'm', row)
+            object.__setattr__(location, 'n', column)
+            columns[column] = location
+        return location
+
+    def __setattr__(self, name: str, value: object) -> None:
+        """Prevent this location from being changed.
+
+        >>> Location(1, 2).m = 3
+        Traceback (most recent call last):
+        AttributeError: Location is immutable
+        """
+        raise AttributeError("Location is immutable")
+
+    def __reduce__(self) -> Tuple[type, Tuple[int, int]]:
+        """Return the information needed to pickle this location, so that
+        unpickling it goes through the intern table.
+
+        """
+        return Location, (self.m, self.n)
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -28,7 +88,17 @@ class Location:
 
         """
         # TODO
-        return self.n == other.n and self.m == other.m
+        return self is other or (self.n == other.n and self.m == other.m)
+
+    def __hash__(self) -> int:
+        """Return a hash of this location, consistent with __eq__.
+
+        """
+        return hash((self.m, self.n))
+
+
+# A distance model: the distance from an origin to a destination.
+DistanceModel = Callable[[Location, Location], int]
 
 
 def manhattan_distance(origin: Location, destination: Location) -> int:
@@ -41,18 +111,163 @@ def manhattan_distance(origin: Location, destination: Location) -> int:
     return distx + disty
 
 
+def distance(origin: Location, destination: Location,
+             model: Optional[DistanceModel] = None) -> int:
+    """Return the distance between the origin and the destination under
+    <model>, or their Manhattan distance if <model> is None.
+
+    Precondition: <model> never returns less than the Manhattan distance,
+    since indexes of idle drivers rely on that to bound their searches.
+
+    >>> distance(Location(1, 2), Location(4, 0))
+    5
+    >>> distance(Location(1, 2), Location(4, 0), lambda _, __: 9)
+    9
+    """
+    if model is None:
+        return abs(destination.m - origin.m) + abs(destination.n - origin.n)
+    return model(origin, destination)
+
+
+class DistanceCache:
+    """A distance model that remembers the distances most recently computed
+    by another distance model.
+
+    Every Location is interned, so the same origin and destination are the
+    same objects each time they are asked for, and the cache never holds
+    two copies of a point. When the cache is full, the distance that was
+    used least recently is forgotten.
+
+    === Attributes ===
+    hits: The number of distances that were found in the cache.
+    misses: The number of distances that had to be computed.
+
+    >>> cache = DistanceCache(manhattan_distance, 2)
+    >>> cache(Location(0, 0), Location(3, 4))
+    7
+    >>> cache(Location(0, 0), Location(3, 4))
+    7
+    >>> cache.hits, cache.misses, cache.hit_rate()
+    (1, 1, 0.5)
+    """
+
+    hits: int
+    misses: int
+
+    # === Private Attributes ===
+    _model: DistanceModel
+    #     The distance model whose distances are cached.
+    _distances: OrderedDict
+    #     The cached distances, keyed by (origin, destination) and ordered
+    #     from least to most recently used.
+    _size: int
+    #     The most distances to keep.
+
+    def __init__(self, model: DistanceModel,
+                 size: int = 65536) -> None:
+        """Initialize an empty DistanceCache of the distances given by
+        <model>, which holds at most <size> distances.
+
+        Precondition: size >= 0.
+        """
+        self.hits = 0
+        self.misses = 0
+        self._model = model
+        self._distances = OrderedDict()
+        self._size = size
+
+    def __len__(self) -> int:
+        """Return the number of distances in this cache.
+
+        """
+        return len(self._distances)
+
+    def __call__(self, origin: Location, destination: Location) -> int:
+        """Return the distance between <origin> and <destination>.
+
+        """
+        key = (origin, destination)
+        distances = self._distances
+        known = distances.get(key)
+        if known is not None:
+            self.hits += 1
+            distances.move_to_end(key)
+            return known
+        self.misses += 1
+        known = self._model(origin, destination)
+        if self._size > 0:
+            distances[key] = known
+            if len(distances) > self._size:
+                distances.popitem(last=False)
+        return known
+
+    def hit_rate(self) -> float:
+        """Return the share of distances that were found in the cache, or
+        0.0 if none have been asked for.
+
+        """
+        asked = self.hits + self.misses
+        return self.hits / asked if asked else 0.0
+
+    def clear(self) -> None:
+        """Forget every cached distance, and reset the counters.
+
+        """
+        self._distances.clear()
+        self.hits = 0
+        self.misses = 0
+
+
 def deserialize_location(location_str: str) -> Location:
     """Deserialize a location.
 
     location_str: A location in the format 'row,col'
+
+    >>> str(deserialize_location('12,345'))
+    '12,345'
     """
-    # TODO
-    row = location_str[0]
-    col = location_str[2]
-    location = Location(int(row), int(col))
-    return location
+    row, col = location_str.split(',')
+    return Location(int(row), int(col))
+
+
+def deserialize_locations(location_strs: Iterable[str]) -> List[Location]:
+    """Deserialize every location in <location_strs>.
+
+    The whole column is parsed at once: the tokens are joined and split
+    into numbers with a single split(), and the numbers converted with a
+    single map(), rather than splitting and converting token by token.
+    Points that have been seen before are then looked up in the intern
+    table directly, without a call to Location.
+
+    location_strs: Locations in the format 'row,col'
+
+    Raise ValueError if a token is not a location.
+
+    >>> [str(location) for location in deserialize_locations(['1,2', '30,4'])]
+    ['1,2', '30,4']
+    >>> deserialize_locations(['1,2', '3'])
+    Traceback (most recent call last):
+    ValueError: not a column of locations
+    """
+    location_strs = list(location_strs)
+    if not location_strs:
+        return []
+    numbers = list(map(int, ",".join(location_strs).split(",")))
+    if len(numbers) != 2 * len(location_strs):
+        raise ValueError("not a column of locations")
+    interned = Location._interned
+    locations = []
+    append = locations.append
+    numbers = iter(numbers)
+    for row, column in zip(numbers, numbers):
+        columns = interned.get(row)
+        location = None if columns is None else columns.get(column)
+        if location is None:
+            location = Location(row, column)
+        append(location)
+    return locations
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all()
+    python_ta.check_all(config={'extra-imports': ['typing', 'collections']})
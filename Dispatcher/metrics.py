@@ -0,0 +1,126 @@
+"""Streaming metrics for the simulation"""
+
+from __future__ import annotations
+import math
+from typing import Dict
+
+
+class Histogram:
+    """A histogram of non-negative numbers, for estimating percentiles in a
+    bounded amount of memory.
+
+    As in an HDR histogram, values are counted in buckets whose width grows
+    with the value: each power of two is split into <precision> equal
+    buckets. A percentile is therefore accurate to within a relative error
+    of 1 / <precision>, and memory only grows with the number of powers of
+    two between the smallest and the largest value. Integers smaller than
+    <precision> are counted exactly.
+
+    >>> histogram = Histogram()
+    >>> for value in range(1, 21):
+    ...     histogram.add(value)
+    >>> histogram.percentile(50), histogram.percentile(90)
+    (10, 18)
+    """
+
+    # === Private Attributes ===
+    _precision: int
+    #     The number of buckets that each power of two is split into.
+    _counts: Dict[int, int]
+    #     The number of positive values in each non-empty bucket.
+    _zeros: int
+    #     The number of zeros that have been added.
+    _count: int
+    #     The number of values that have been added.
+    _min: float
+    #     The smallest value that has been added, or math.inf if none has.
+    _max: float
+    #     The largest value that has been added, or -math.inf if none has.
+
+    def __init__(self, precision: int = 32) -> None:
+        """Initialize an empty Histogram.
+
+        Precondition: precision > 0.
+        """
+        self._precision = precision
+        self._counts = {}
+        self._zeros = 0
+        self._count = 0
+        self._min = math.inf
+        self._max = -math.inf
+
+    def __len__(self) -> int:
+        """Return the number of values that have been added.
+
+        """
+        return self._count
+
+    def add(self, value: float) -> None:
+        """Count <value>.
+
+        Precondition: value >= 0.
+        """
+        self._count += 1
+        if value < self._min:
+            self._min = value
+        if value > self._max:
+            self._max = value
+        if value == 0:
+            self._zeros += 1
+        else:
+            key = self._bucket(value)
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def copy(self) -> Histogram:
+        """Return a copy of this histogram.
+
+        """
+        other = Histogram(self._precision)
+        other._counts = dict(self._counts)
+        other._zeros = self._zeros
+        other._count = self._count
+        other._min = self._min
+        other._max = self._max
+        return other
+
+    def percentile(self, percent: float) -> float:
+        """Return an estimate of the <percent>th percentile of the values
+        that have been added, or nan if none have.
+
+        The estimate is the lowest value in the bucket that holds the value
+        of that rank, so it is never more than the true percentile.
+
+        Precondition: 0 <= percent <= 100.
+        """
+        if self._count == 0:
+            return math.nan
+        rank = max(1, math.ceil(percent / 100 * self._count))
+        seen = self._zeros
+        if seen >= rank:
+            return 0
+        for key in sorted(self._counts):
+            seen += self._counts[key]
+            if seen >= rank:
+                return min(max(self._lowest(key), self._min), self._max)
+        return self._max
+
+    def _bucket(self, value: float) -> int:
+        """Return the bucket that the positive number <value> is counted in.
+
+        """
+        mantissa, exponent = math.frexp(value)
+        return exponent * self._precision \
+            + int((mantissa - 0.5) * 2 * self._precision)
+
+    def _lowest(self, key: int) -> float:
+        """Return the lowest value that is counted in the bucket <key>.
+
+        """
+        exponent, sub_bucket = divmod(key, self._precision)
+        value = math.ldexp(0.5 + sub_bucket / (2 * self._precision), exponent)
+        return int(value) if value == int(value) else value
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['math', 'typing']})
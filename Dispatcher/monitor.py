@@ -14,10 +14,14 @@ REQUEST: A constant used for the request activity description.
 CANCEL: A constant used for the cancel activity description.
 PICKUP: A constant used for the pickup activity description.
 DROPOFF: A constant used for the dropoff activity description.
+WAIT_TIME: A constant used for the rider wait time metric.
+UTILIZATION: A constant used for the driver utilization metric.
+RIDE_DISTANCE: A constant used for the ride distance metric.
 """
 
-from typing import Dict, List
-from location import Location, manhattan_distance
+from typing import Dict, List, Optional, Tuple
+from location import DistanceModel, Location, distance
+from metrics import Histogram
 
 RIDER = "rider"
 DRIVER = "driver"
@@ -27,6 +31,10 @@ CANCEL = "cancel"
 PICKUP = "pickup"
 DROPOFF = "dropoff"
 
+WAIT_TIME = "rider_wait_time"
+UTILIZATION = "driver_utilization"
+RIDE_DISTANCE = "driver_ride_distance"
+
 
 class Activity:
     """An activity that occurs in the simulation.
@@ -38,6 +46,8 @@ class Activity:
     location: The location at which the activity occurred.
     """
 
+    __slots__ = ('time', 'description', 'id', 'location')
+
     time: int
     description: str
     id: str
@@ -57,8 +67,15 @@ class Activity:
 class Monitor:
     """A monitor keeps a record of activities that it is notified about.
     When required, it generates a report of the activities it has recorded.
+
+    === Attributes ===
+    model: The distance model that distances driven are measured with, or
+        None for Manhattan distances. A Simulation sets it to its
+        dispatcher's.
     """
 
+    model: Optional[DistanceModel]
+
     # === Private Attributes ===
     _activities: Dict[str, Dict[str, List[Activity]]]
     #       A dictionary whose key is a category, and value is another
@@ -69,6 +86,7 @@ class Monitor:
         """Initialize a Monitor.
 
         """
+        self.model = None
         self._activities = {
             RIDER: {},
             DRIVER: {}
@@ -128,23 +146,23 @@ class Monitor:
         """Return the average distance drivers have driven.
 
         """
-        distance = 0
+        total = 0
         count = 0
         for activities in self._activities[DRIVER].values():
             if len(activities) >= 2:
                 for i in range(0, len(activities) - 1, 1):
-                    distance += manhattan_distance(activities[i].location,
-                                                   activities[i + 1].location)
+                    total += distance(activities[i].location,
+                                      activities[i + 1].location, self.model)
             count += 1
 
-        return distance / count
+        return total / count
 
     def _average_ride_distance(self) -> float:
         """Return the average distance drivers have driven on rides.
 
         """
         curr_act = []
-        distance = 0
+        total = 0
         count = 0
         for activities in self._activities[DRIVER].values():
             if len(activities) >= 3:
@@ -154,11 +172,325 @@ class Monitor:
                 if curr_act[i].description == PICKUP \
                         and (curr_act[i + 1].description == DROPOFF
                              or curr_act[i + 1].description == REQUEST):
-                    distance += manhattan_distance(curr_act[i].location,
-                                                   curr_act[i + 1].location)
+                    total += distance(curr_act[i].location,
+                                      curr_act[i + 1].location, self.model)
             count += 1
             curr_act = []
-        return distance / count
+        return total / count
+
+
+class StreamingMonitor(Monitor):
+    """A monitor that keeps running totals instead of a record of every
+    activity.
+
+    A StreamingMonitor produces exactly the same report as a Monitor that
+    was notified of the same activities, but it only keeps a few values for
+    each driver and rider, no matter how many activities they have, and it
+    does not need another pass over the activities to make the report.
+    """
+
+    # === Private Attributes ===
+    _riders: Dict[str, Optional[int]]
+    #       For each rider, the time of their first activity, or None once
+    #       they have had a second activity and so have finished waiting.
+    _drivers: Dict[str, list]
+    #       For each driver, a list of the location and description of their
+    #       latest activity, their number of activities up to a maximum of
+    #       three, and the distance they have driven on rides that has not
+    #       been added to _ride_distance yet.
+    _wait_time: int
+    #       The total wait time of the riders who have finished waiting.
+    _waits: int
+    #       The number of riders who have finished waiting.
+    _total_distance: int
+    #       The total distance driven by all drivers.
+    _ride_distance: int
+    #       The total distance driven on rides by drivers who have had at
+    #       least three activities.
+
+    def __init__(self) -> None:
+        """Initialize a StreamingMonitor.
+
+        """
+        Monitor.__init__(self)
+        self._riders = {}
+        self._drivers = {}
+        self._wait_time = 0
+        self._waits = 0
+        self._total_distance = 0
+        self._ride_distance = 0
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return "Monitor ({} drivers, {} riders)".format(
+            len(self._drivers), len(self._riders))
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        if category == RIDER:
+            if identifier not in self._riders:
+                self._riders[identifier] = timestamp
+            else:
+                requested = self._riders[identifier]
+                if requested is not None:
+                    self._wait_time += timestamp - requested
+                    self._waits += 1
+                    self._riders[identifier] = None
+            return
+
+        state = self._drivers.get(identifier)
+        if state is None:
+            self._drivers[identifier] = [location, description, 1, 0]
+            return
+        previous, previous_description, count, ride = state
+        driven = distance(previous, location, self.model)
+        self._total_distance += driven
+        if previous_description == PICKUP and description in (DROPOFF,
+                                                               REQUEST):
+            ride += driven
+        if count < 3:
+            count += 1
+        if count == 3:
+            # Rides only count towards the report once a driver has had
+            # three activities.
+            self._ride_distance += ride
+            ride = 0
+        state[:] = [location, description, count, ride]
+
+    def _average_wait_time(self) -> float:
+        """Return the average wait time of riders that have either been picked
+        up or have cancelled their ride.
+
+        """
+        return self._wait_time / self._waits
+
+    def _average_total_distance(self) -> float:
+        """Return the average distance drivers have driven.
+
+        """
+        return self._total_distance / len(self._drivers)
+
+    def _average_ride_distance(self) -> float:
+        """Return the average distance drivers have driven on rides.
+
+        """
+        return self._ride_distance / len(self._drivers)
+
+
+class Usage:
+    """How much of their time a driver has spent busy, as tracked by a
+    MetricsMonitor.
+
+    === Attributes ===
+    latest: The time of the driver's latest activity.
+    window: The number of the window that contains <latest>.
+    window_busy: The time the driver has been busy in that window.
+    window_online: The time the driver has been online in that window.
+    busy: The time the driver has been busy in total.
+    online: The time the driver has been online in total.
+    """
+
+    __slots__ = ('latest', 'window', 'window_busy', 'window_online', 'busy',
+                 'online')
+
+    latest: int
+    window: int
+    window_busy: int
+    window_online: int
+    busy: int
+    online: int
+
+    def __init__(self, timestamp: int, window: int) -> None:
+        """Initialize the Usage of a driver whose first activity is at
+        <timestamp>, in window number <window>.
+
+        """
+        self.latest = timestamp
+        self.window = window
+        self.window_busy = 0
+        self.window_online = 0
+        self.busy = 0
+        self.online = 0
+
+
+class MetricsMonitor(StreamingMonitor):
+    """A streaming monitor that also reports percentiles of rider wait time,
+    driver utilization and ride distance, over the whole simulation and for
+    each window of simulated time.
+
+    The percentiles are estimated with Histograms, so memory does not grow
+    with the number of activities.
+
+    A rider's wait time counts towards the window in which they made their
+    request, and a ride's distance towards the window in which it ended.
+    A driver's utilization is the fraction of their time, from their first
+    activity to their latest, that they spent carrying a rider between a
+    pickup and the following dropoff. Each window has one utilization value
+    for each driver who was active in it. The monitor is not told when a
+    driver is dispatched, so driving to a rider does not count as busy.
+
+    === Attributes ===
+    window: The length of each window of simulated time.
+    percentiles: The percentiles to report for each metric.
+    """
+
+    window: int
+    percentiles: Tuple[float, ...]
+
+    # === Private Attributes ===
+    _overall: Dict[str, Histogram]
+    #       The wait time and ride distance histograms for the whole
+    #       simulation, keyed by metric.
+    _windows: Dict[int, Dict[str, Histogram]]
+    #       The histograms for each window that has had a value, keyed by
+    #       window number and then by metric.
+    _usage: Dict[str, Usage]
+    #       How much of their time each driver has spent busy.
+
+    def __init__(self, window: int = 60,
+                 percentiles: Tuple[float, ...] = (50, 95, 99)) -> None:
+        """Initialize a MetricsMonitor with windows <window> units long.
+
+        Precondition: window > 0.
+        """
+        StreamingMonitor.__init__(self)
+        self.window = window
+        self.percentiles = percentiles
+        self._overall = {WAIT_TIME: Histogram(), RIDE_DISTANCE: Histogram()}
+        self._windows = {}
+        self._usage = {}
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        if category == RIDER:
+            requested = self._riders.get(identifier)
+            if requested is not None:
+                self._record(WAIT_TIME, requested, timestamp - requested)
+        else:
+            state = self._drivers.get(identifier)
+            on_ride = state is not None and state[1] == PICKUP \
+                and description == DROPOFF
+            if on_ride:
+                self._record(RIDE_DISTANCE, timestamp,
+                             distance(state[0], location, self.model))
+            self._use(identifier, timestamp, on_ride)
+        StreamingMonitor.notify(self, timestamp, category, description,
+                                identifier, location)
+
+    def report(self) -> Dict[str, float]:
+        """Return a report of the activities that have occurred.
+
+        This is the report of a Monitor, with the percentiles of each metric
+        added under keys such as 'rider_wait_time_p95'.
+        """
+        report = StreamingMonitor.report(self)
+        utilization = Histogram()
+        for usage in self._usage.values():
+            if usage.online > 0:
+                utilization.add(usage.busy / usage.online)
+        histograms = dict(self._overall)
+        histograms[UTILIZATION] = utilization
+        report.update(self._percentiles(histograms))
+        return report
+
+    def window_report(self) -> Dict[int, Dict[str, float]]:
+        """Return the percentiles of each metric in each window that has had
+        any values, keyed by the time at which the window starts.
+
+        >>> monitor = MetricsMonitor(window=10)
+        >>> monitor.notify(3, RIDER, REQUEST, "a", Location(0, 0))
+        >>> monitor.notify(15, RIDER, PICKUP, "a", Location(0, 0))
+        >>> monitor.window_report()[0]["rider_wait_time_p50"]
+        12
+        """
+        windows = {number: dict(histograms)
+                   for number, histograms in self._windows.items()}
+        copied = set()
+        for usage in self._usage.values():
+            # Count each driver's window in progress as if it ended now,
+            # without changing the monitor's own histograms.
+            if usage.window_online > 0:
+                histograms = windows.setdefault(usage.window, {})
+                if usage.window not in copied:
+                    histograms[UTILIZATION] = histograms.get(
+                        UTILIZATION, Histogram()).copy()
+                    copied.add(usage.window)
+                histograms[UTILIZATION].add(usage.window_busy
+                                            / usage.window_online)
+        return {number * self.window: self._percentiles(histograms)
+                for number, histograms in sorted(windows.items())}
+
+    def _percentiles(self, histograms: Dict[str, Histogram]) \
+            -> Dict[str, float]:
+        """Return the percentiles of each histogram in <histograms>, keyed
+        by metric and percentile.
+
+        """
+        return {"{}_p{:g}".format(metric, percentile):
+                histogram.percentile(percentile)
+                for metric, histogram in histograms.items()
+                for percentile in self.percentiles}
+
+    def _record(self, metric: str, timestamp: int, value: float) -> None:
+        """Add <value> to the histograms for <metric>, overall and in the
+        window that contains <timestamp>.
+
+        """
+        if metric in self._overall:
+            self._overall[metric].add(value)
+        histograms = self._windows.setdefault(timestamp // self.window, {})
+        if metric not in histograms:
+            histograms[metric] = Histogram()
+        histograms[metric].add(value)
+
+    def _use(self, identifier: str, timestamp: int, busy: bool) -> None:
+        """Account for the time between the driver <identifier>'s latest
+        activity and <timestamp>, which they spent busy iff <busy>.
+
+        """
+        usage = self._usage.get(identifier)
+        if usage is None:
+            self._usage[identifier] = Usage(timestamp,
+                                            timestamp // self.window)
+            return
+        start = usage.latest
+        while start < timestamp:
+            number = start // self.window
+            if number != usage.window:
+                if usage.window_online > 0:
+                    self._record(UTILIZATION, usage.window * self.window,
+                                 usage.window_busy / usage.window_online)
+                usage.window = number
+                usage.window_busy = 0
+                usage.window_online = 0
+            end = min(timestamp, (number + 1) * self.window)
+            if busy:
+                usage.window_busy += end - start
+                usage.busy += end - start
+            usage.window_online += end - start
+            usage.online += end - start
+            start = end
+        usage.latest = timestamp
 
 
 if __name__ == "__main__":
@@ -166,4 +498,4 @@ if __name__ == "__main__":
     python_ta.check_all(
         config={
             'max-args': 6,
-            'extra-imports': ['typing', 'location']})
+            'extra-imports': ['typing', 'location', 'metrics']})
@@ -0,0 +1,237 @@
+"""Profiling the simulation
+
+A Profiler records where the time goes in a Simulation: how many events of
+each class were done and how long their do() took, how long each Dispatcher,
+Monitor and event queue method took, and how many events were queued at each
+point in simulated time. Give one to a Simulation to turn it on:
+
+    profiler = Profiler()
+    Simulation(profiler=profiler).run(iter_events("events.txt"))
+    profiler.write_json("profile.json")
+    profiler.write_folded("profile.folded")
+
+The folded file has one line per call stack, with the microseconds spent in
+that stack and not in anything it called, and can be drawn with flamegraph.pl
+or loaded into speedscope.
+
+A Simulation without a profiler does no extra work beyond one check per
+event.
+"""
+
+from __future__ import annotations
+import functools
+import json
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from event import Event
+
+
+RUN = "Simulation.run"
+
+DISPATCHER_METHODS = ("request_driver", "request_rider", "cancel_ride",
+                      "match")
+MONITOR_METHODS = ("notify", "report")
+QUEUE_METHODS = ("add", "add_all", "remove", "discard")
+
+
+class Profiler:
+    """A record of where the time went in a simulation.
+
+    === Attributes ===
+    depths: The number of queued events each time simulated time moved on,
+        as (timestamp, depth) pairs. The depth is counted just before the
+        first event with that timestamp is done.
+    """
+
+    depths: List[Tuple[int, int]]
+
+    # === Private Attributes ===
+    _stats: Dict[str, List[float]]
+    #     The number of calls, total seconds and longest call in seconds of
+    #     each profiled event class and method, keyed by name.
+    _stacks: Dict[Tuple[str, ...], float]
+    #     The seconds spent in each call stack, not counting the calls made
+    #     from it.
+    _frame: Tuple[str, ...]
+    #     The call stack of the event or method that is running.
+    _inner: float
+    #     The seconds spent in calls made from the running frame.
+    _depth: int
+    #     The number of events in the event queue.
+    _started: Optional[float]
+    #     When the profiled run started, or None if it is not running.
+    _patched: List[Tuple[object, str]]
+    #     The objects and method names that have been wrapped.
+
+    def __init__(self) -> None:
+        """Initialize a Profiler with nothing recorded.
+
+        """
+        self.depths = []
+        self._stats = {}
+        self._stacks = {}
+        self._frame = (RUN,)
+        self._inner = 0.0
+        self._depth = 0
+        self._started = None
+        self._patched = []
+
+    def start(self, dispatcher: object, monitor: object,
+              events: object) -> None:
+        """Start profiling a run of a simulation with <dispatcher>,
+        <monitor> and the event queue <events>.
+
+        """
+        self._wrap(dispatcher, DISPATCHER_METHODS, False)
+        self._wrap(monitor, MONITOR_METHODS, False)
+        self._wrap(events, QUEUE_METHODS, True)
+        self._started = time.perf_counter()
+
+    def stop(self) -> None:
+        """Stop profiling, and put back the methods that were wrapped.
+
+        """
+        elapsed = time.perf_counter() - self._started
+        self._started = None
+        self._add(RUN, elapsed)
+        self._stacks[(RUN,)] = self._stacks.get((RUN,), 0.0) \
+            + elapsed - self._inner
+        self._inner = 0.0
+        for instance, name in self._patched:
+            delattr(instance, name)
+        self._patched = []
+
+    def do(self, event: Event, dispatcher: object, monitor: object) \
+            -> Optional[List[Event]]:
+        """Do <event> with <dispatcher> and <monitor>, as Simulation.run
+        does, and record how long it took.
+
+        """
+        if not self.depths or self.depths[-1][0] != event.timestamp:
+            self.depths.append((event.timestamp, self._depth))
+        return self._call(type(event).__name__ + ".do", event.do,
+                          (dispatcher, monitor), {})
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Return the number of calls, the total and mean microseconds, and
+        the longest call in microseconds of each event class and method.
+
+        >>> profiler = Profiler()
+        >>> profiler._add("Pickup.do", 0.002)
+        >>> profiler._add("Pickup.do", 0.004)
+        >>> profiler.stats()["Pickup.do"]
+        {'calls': 2, 'total_us': 6000.0, 'mean_us': 3000.0, 'max_us': 4000.0}
+        """
+        return {name: {"calls": calls,
+                       "total_us": round(total * 1e6, 3),
+                       "mean_us": round(total / calls * 1e6, 3),
+                       "max_us": round(longest * 1e6, 3)}
+                for name, (calls, total, longest)
+                in sorted(self._stats.items())}
+
+    def folded(self) -> List[str]:
+        """Return a line in the folded stack format for every call stack:
+        the frames separated by semicolons, then the whole number of
+        microseconds spent in that stack itself.
+
+        >>> profiler = Profiler()
+        >>> profiler._stacks[(RUN, "Pickup.do")] = 0.0025
+        >>> profiler.folded()
+        ['Simulation.run;Pickup.do 2500']
+        """
+        return ["{} {}".format(";".join(stack), round(seconds * 1e6))
+                for stack, seconds in sorted(self._stacks.items())]
+
+    def write_json(self, filename: str) -> None:
+        """Write the stats and queue depths to <filename> as JSON.
+
+        """
+        with open(filename, "w") as file:
+            json.dump({"stats": self.stats(),
+                       "queue_depth": self.depths}, file, indent=2)
+
+    def write_folded(self, filename: str) -> None:
+        """Write the call stacks to <filename> in the folded stack format.
+
+        """
+        with open(filename, "w") as file:
+            for line in self.folded():
+                file.write(line + "\n")
+
+    def _wrap(self, instance: object, names: Iterable[str],
+              queue: bool) -> None:
+        """Replace each method of <instance> in <names> with one that is
+        profiled, for as long as the profiler is running. If <queue>,
+        <instance> is the event queue.
+
+        """
+        owner = type(instance).__name__
+        for name in names:
+            method = getattr(instance, name, None)
+            if method is None:
+                continue
+            setattr(instance, name,
+                    self._profiled(owner + "." + name, method,
+                                   name if queue else None))
+            self._patched.append((instance, name))
+
+    def _profiled(self, label: str, method: Callable,
+                  queue_method: Optional[str]) -> Callable:
+        """Return a function that calls <method> and records how long it
+        took under <label>. If <method> is the event queue method called
+        <queue_method>, the queue depth is kept up to date too.
+
+        """
+        @functools.wraps(method)
+        def profiled(*args: object, **kwargs: object) -> object:
+            """Call the wrapped method with <args> and <kwargs>.
+
+            """
+            if queue_method == "add":
+                self._depth += 1
+            elif queue_method == "add_all":
+                args = (list(args[0]),)
+                self._depth += len(args[0])
+            elif queue_method in ("remove", "discard"):
+                self._depth -= 1
+            return self._call(label, method, args, kwargs)
+        return profiled
+
+    def _call(self, label: str, method: Callable,
+              args: Tuple, kwargs: Dict[str, object]) -> object:
+        """Call <method> with <args> and <kwargs> as a frame called <label>
+        on top of the call stack, and record how long it took.
+
+        """
+        outer_frame, outer_inner = self._frame, self._inner
+        self._frame = outer_frame + (label,)
+        self._inner = 0.0
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stacks[self._frame] = self._stacks.get(self._frame, 0.0) \
+                + elapsed - self._inner
+            self._add(label, elapsed)
+            self._frame = outer_frame
+            self._inner = outer_inner + elapsed
+
+    def _add(self, label: str, elapsed: float) -> None:
+        """Count a call of <label> that took <elapsed> seconds.
+
+        """
+        stats = self._stats.get(label)
+        if stats is None:
+            self._stats[label] = [1, elapsed, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['functools', 'json', 'time',
+                                                  'typing', 'event']})
@@ -7,8 +7,13 @@ WAITING: A constant used for the waiting rider status.
 CANCELLED: A constant used for the cancelled rider status.
 SATISFIED: A constant used for the satisfied rider status
 """
+from __future__ import annotations
+from typing import Optional, TYPE_CHECKING
 from location import Location
 
+if TYPE_CHECKING:
+    from event import Cancellation
+
 
 WAITING = "waiting"
 CANCELLED = "cancelled"
@@ -19,13 +24,22 @@ class Rider:
 
     """A rider for a ride-sharing service.
 
+    === Attributes ===
+    cancellation: The Cancellation event that will end this rider's wait if
+        no driver picks them up first, or None if none has been scheduled or
+        it is no longer needed.
     """
+
+    __slots__ = ('id', 'patience', 'origin', 'destination', 'status',
+                 'curr_wait', 'cancellation')
+
     id: str
     patience: int
     origin: Location
     destination: Location
     status: str
     curr_wait: int
+    cancellation: Optional[Cancellation]
 
     def __init__(self, identifier: str, patience: int, origin: Location,
                  destination: Location) -> None:
@@ -39,6 +53,7 @@ class Rider:
         self.destination = destination
         self.status = WAITING
         self.curr_wait = 0
+        self.cancellation = None
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -58,4 +73,5 @@ class Rider:
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all(config={'extra-imports': ['location']})
+    python_ta.check_all(config={'extra-imports': ['typing', 'location',
+                                                  'event']})
@@ -0,0 +1,305 @@
+"""Road networks
+
+A RoadNetwork is a distance model (see location.DistanceModel): the
+distance between two locations is the length of the shortest route between
+them along a weighted graph of roads, rather than their Manhattan distance
+on an open grid. A road network file has one road per line,
+
+    m1,n1 m2,n2 [length]
+
+between the intersections at locations m1,n1 and m2,n2, which can be driven
+both ways. The length defaults to the Manhattan distance between its ends,
+and can never be less than it, so that no route is shorter than the
+Manhattan distance between its ends. Blank lines and lines starting with #
+are ignored.
+
+A location that is not an intersection is joined to the network at the
+nearest intersection, and the Manhattan distance to that intersection is
+added to the length of every route to or from it.
+
+Shortest routes are found with A* search, guided by ALT (A*, landmarks and
+the triangle inequality) bounds: the distances from a few landmark
+intersections to every other intersection are computed when the network is
+loaded, and give a lower bound on the distance between any two
+intersections that is much tighter than the Manhattan distance. The most
+recent routes are kept in a location.DistanceCache, whose hit rate shows
+how often a route was asked for again.
+
+Load a network and give it to a dispatcher as its distance model:
+
+    Simulation(dispatcher=Dispatcher(model=load_roads("roads.txt")))
+"""
+
+from __future__ import annotations
+import heapq
+from typing import Dict, Iterable, List, Optional, Tuple
+from location import DistanceCache, Location, deserialize_location, \
+    manhattan_distance
+
+
+class RoadNetwork:
+    """A network of roads between intersections, which gives the length of
+    the shortest route between any two locations.
+
+    >>> corner = [Location(0, 0), Location(0, 4), Location(4, 4)]
+    >>> roads = RoadNetwork([(corner[0], corner[1], None),
+    ...                      (corner[1], corner[2], None),
+    ...                      (corner[0], corner[2], 20)])
+    >>> roads(Location(0, 0), Location(4, 4))
+    8
+    >>> roads(Location(1, 0), Location(4, 3))
+    10
+
+    === Attributes ===
+    cache: The lengths of the most recent routes.
+    """
+
+    cache: DistanceCache
+
+    # === Private Attributes ===
+    _locations: List[Location]
+    #     The location of each intersection, by intersection number.
+    _numbers: Dict[Tuple[int, int], int]
+    #     The number of the intersection at each (m, n) point.
+    _roads: List[List[Tuple[int, int]]]
+    #     The (intersection, length) of each road out of each intersection.
+    _landmarks: List[List[int]]
+    #     For each landmark, the length of the shortest route between it and
+    #     every intersection, by intersection number.
+    _joins: Dict[Location, Tuple[int, int]]
+    #     The (intersection, Manhattan distance) at which each location that
+    #     has been looked up joins the network.
+
+    def __init__(self,
+                 roads: Iterable[Tuple[Location, Location, Optional[int]]],
+                 landmarks: int = 8, cache_size: int = 65536) -> None:
+        """Initialize a RoadNetwork with the (end, end, length) of each road
+        in <roads>, where the length is None if it is the Manhattan distance
+        between the ends.
+
+        landmarks: The number of landmarks to bound routes with.
+        cache_size: The number of recent routes to cache.
+
+        Raise ValueError if a road is shorter than the Manhattan distance
+        between its ends, or if some intersection cannot be reached from
+        another.
+
+        Precondition: landmarks >= 1 and cache_size >= 0.
+        """
+        self._locations = []
+        self._numbers = {}
+        self._roads = []
+        for start, end, length in roads:
+            shortest = manhattan_distance(start, end)
+            if length is None:
+                length = shortest
+            elif length < shortest:
+                raise ValueError("road {} {} is shorter than {}".format(
+                    start, end, shortest))
+            first, second = self._number(start), self._number(end)
+            self._roads[first].append((second, length))
+            self._roads[second].append((first, length))
+        if not self._locations:
+            raise ValueError("a road network needs at least one road")
+        self._landmarks = []
+        self._choose_landmarks(landmarks)
+        self._joins = {}
+        self.cache = DistanceCache(self._route, cache_size)
+
+    def __len__(self) -> int:
+        """Return the number of intersections.
+
+        """
+        return len(self._locations)
+
+    def __call__(self, origin: Location, destination: Location) -> int:
+        """Return the length of the shortest route from <origin> to
+        <destination>.
+
+        """
+        if origin == destination:
+            return 0
+        return self.cache(origin, destination)
+
+    def _route(self, origin: Location, destination: Location) -> int:
+        """Return the length of the shortest route from <origin> to
+        <destination>, without looking in the cache.
+
+        """
+        start, to_start = self._join(origin)
+        end, from_end = self._join(destination)
+        return to_start + self._search(start, end) + from_end
+
+    def _number(self, location: Location) -> int:
+        """Return the number of the intersection at <location>, numbering it
+        if it is new.
+
+        """
+        point = (location.m, location.n)
+        number = self._numbers.get(point)
+        if number is None:
+            number = len(self._locations)
+            self._numbers[point] = number
+            self._locations.append(location)
+            self._roads.append([])
+        return number
+
+    def _choose_landmarks(self, count: int) -> None:
+        """Choose <count> landmarks, or one per intersection if there are
+        fewer, each as far as possible from those chosen before it, and
+        compute their distance tables.
+
+        Raise ValueError if some intersection cannot be reached from
+        another.
+        """
+        table = self._dijkstra(0)
+        if len(table) < len(self._locations):
+            raise ValueError("some intersections cannot be reached")
+        # The first landmark is the intersection farthest from an arbitrary
+        # one, and each later one is the farthest from every landmark so far.
+        closest = [table[number] for number in range(len(table))]
+        for _ in range(min(count, len(self._locations))):
+            landmark = max(range(len(closest)), key=closest.__getitem__)
+            table = self._dijkstra(landmark)
+            table = [table[number] for number in range(len(table))]
+            if not self._landmarks:
+                closest = table
+            else:
+                closest = [min(pair) for pair in zip(closest, table)]
+            self._landmarks.append(table)
+
+    def _dijkstra(self, source: int) -> Dict[int, int]:
+        """Return the length of the shortest route from <source> to every
+        intersection that can be reached from it.
+
+        """
+        lengths = {}
+        frontier = [(0, source)]
+        while frontier:
+            length, number = heapq.heappop(frontier)
+            if number in lengths:
+                continue
+            lengths[number] = length
+            for neighbour, road in self._roads[number]:
+                if neighbour not in lengths:
+                    heapq.heappush(frontier, (length + road, neighbour))
+        return lengths
+
+    def _search(self, start: int, end: int) -> int:
+        """Return the length of the shortest route between the intersections
+        <start> and <end>.
+
+        """
+        if start == end:
+            return 0
+        locations = self._locations
+        target = locations[end]
+        bounds = [(table, table[end]) for table in self._landmarks]
+
+        def estimate(number: int) -> int:
+            """Return a lower bound on the length of the shortest route from
+            intersection <number> to <end>.
+
+            """
+            location = locations[number]
+            best = abs(target.m - location.m) + abs(target.n - location.n)
+            for table, to_end in bounds:
+                bound = abs(table[number] - to_end)
+                if bound > best:
+                    best = bound
+            return best
+
+        # Every bound is consistent, so each intersection is settled the
+        # first time it is popped.
+        settled = set()
+        lengths = {start: 0}
+        frontier = [(estimate(start), 0, start)]
+        while frontier:
+            _, length, number = heapq.heappop(frontier)
+            if number == end:
+                return length
+            if number in settled:
+                continue
+            settled.add(number)
+            for neighbour, road in self._roads[number]:
+                reached = length + road
+                if neighbour not in settled \
+                        and reached < lengths.get(neighbour, reached + 1):
+                    lengths[neighbour] = reached
+                    heapq.heappush(frontier, (reached + estimate(neighbour),
+                                              reached, neighbour))
+        raise ValueError("no route from {} to {}".format(
+            locations[start], target))
+
+    def _join(self, location: Location) -> Tuple[int, int]:
+        """Return the intersection nearest to <location> and the Manhattan
+        distance between them.
+
+        """
+        join = self._joins.get(location)
+        if join is not None:
+            return join
+        number = self._numbers.get((location.m, location.n))
+        if number is not None:
+            join = (number, 0)
+        else:
+            # Search the points at each Manhattan distance from the location
+            # in turn, until one of them is an intersection.
+            radius = 1
+            while join is None:
+                for point in _diamond(location, radius):
+                    number = self._numbers.get(point)
+                    if number is not None:
+                        join = (number, radius)
+                        break
+                radius += 1
+        self._joins[location] = join
+        return join
+
+
+def _diamond(centre: Location, radius: int) -> Iterable[Tuple[int, int]]:
+    """Yield the (m, n) points at Manhattan distance <radius> from
+    <centre>, in a fixed order.
+
+    These are plain tuples rather than Locations, since most of them are
+    only probed for and then thrown away.
+
+    Precondition: radius >= 1.
+    """
+    m, n = centre.m, centre.n
+    for step in range(radius):
+        yield m + step, n + radius - step
+        yield m + radius - step, n - step
+        yield m - step, n - radius + step
+        yield m - radius + step, n + step
+
+
+def load_roads(filename: str, landmarks: int = 8,
+               cache_size: int = 65536) -> RoadNetwork:
+    """Return the road network in the road network file <filename>.
+
+    landmarks: The number of landmarks to bound routes with.
+    cache_size: The number of recent routes to cache.
+
+    Raise ValueError if a line is not a road, or the roads do not make a
+    valid network.
+    """
+    roads = []
+    with open(filename, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            tokens = line.split()
+            if len(tokens) not in (2, 3):
+                raise ValueError("not a road: {!r}".format(line))
+            length = int(tokens[2]) if len(tokens) == 3 else None
+            roads.append((deserialize_location(tokens[0]),
+                          deserialize_location(tokens[1]), length))
+    return RoadNetwork(roads, landmarks, cache_size)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['typing', 'location',
+                                                  'heapq']})
@@ -0,0 +1,222 @@
+"""Synthetic scenarios for the simulation
+
+A Scenario describes a city: how big its grid is, how many drivers it has
+and how fast they drive, how often riders request rides over the course of
+the simulation, where those riders tend to be, and how patient they are.
+generate() turns a scenario into a stream of DriverRequest and RiderRequest
+events, and write_events() saves that stream as an event file. The same
+scenario and seed always produce the same events.
+
+Run this module to write an event file, e.g.
+
+    python scenario.py city.txt --grid 200 --drivers 500 --duration 3600 \\
+        --rate 0:1 1800:20 3600:1 --hotspot 50,50,10 --hotspot 150,120,20
+"""
+
+import argparse
+import math
+import random
+from typing import Iterator, List, Optional, Tuple
+from driver import Driver
+from event import Event, DriverRequest, RiderRequest
+from location import Location
+from rider import Rider
+
+
+class Scenario:
+    """The parameters of a synthetic simulation.
+
+    === Attributes ===
+    grid: The number of rows and of columns in the grid.
+    drivers: The number of drivers, who all request a rider at time 0.
+    duration: Riders request rides at times in [0, duration).
+    rates: The mean number of rider requests per time unit, as a list of
+        (time, rate) points. The rate between two points is interpolated
+        linearly, and is constant before the first point and after the last.
+    hotspots: Places that riders tend to be, as (row, column, spread). The
+        origin and destination of a rider near a hotspot are normally
+        distributed around it, with standard deviation <spread>.
+    hotspot_share: The fraction of origins and destinations that are near a
+        hotspot, if there are any. The rest are spread evenly over the grid.
+    speeds: The lowest and highest driver speed.
+    patience: The lowest and highest rider patience.
+    seed: The seed for the random number generator.
+    """
+
+    grid: int
+    drivers: int
+    duration: int
+    rates: List[Tuple[int, float]]
+    hotspots: List[Tuple[int, int, float]]
+    hotspot_share: float
+    speeds: Tuple[int, int]
+    patience: Tuple[int, int]
+    seed: int
+
+    def __init__(self, grid: int = 100, drivers: int = 100,
+                 duration: int = 1000,
+                 rates: Optional[List[Tuple[int, float]]] = None,
+                 hotspots: Optional[List[Tuple[int, int, float]]] = None,
+                 hotspot_share: float = 0.7,
+                 speeds: Tuple[int, int] = (1, 3),
+                 patience: Tuple[int, int] = (5, 30),
+                 seed: int = 0) -> None:
+        """Initialize a Scenario. By default riders arrive at a constant
+        rate of one per time unit, and there are no hotspots.
+
+        """
+        self.grid = grid
+        self.drivers = drivers
+        self.duration = duration
+        self.rates = [(0, 1.0)] if rates is None else sorted(rates)
+        self.hotspots = [] if hotspots is None else hotspots
+        self.hotspot_share = hotspot_share
+        self.speeds = speeds
+        self.patience = patience
+        self.seed = seed
+
+    def rate(self, time: int) -> float:
+        """Return the mean number of rider requests per time unit at <time>.
+
+        >>> Scenario(rates=[(0, 1.0), (10, 3.0)]).rate(5)
+        2.0
+        """
+        previous_time, previous_rate = self.rates[0]
+        if time <= previous_time:
+            return previous_rate
+        for next_time, next_rate in self.rates[1:]:
+            if time <= next_time:
+                fraction = (time - previous_time) / (next_time - previous_time)
+                return previous_rate + fraction * (next_rate - previous_rate)
+            previous_time, previous_rate = next_time, next_rate
+        return previous_rate
+
+
+def generate(scenario: Scenario) -> Iterator[Event]:
+    """Yield the events of <scenario> in timestamp order.
+
+    >>> events = list(generate(Scenario(drivers=2, duration=5, seed=1)))
+    >>> [str(event) for event in events[:3]]
+    ['0 -- d0: Request a rider', '0 -- d1: Request a rider', \
+'0 -- r0: Request a driver']
+    """
+    rng = random.Random(scenario.seed)
+    for i in range(scenario.drivers):
+        driver = Driver("d{}".format(i), _uniform(rng, scenario.grid),
+                        rng.randint(*scenario.speeds))
+        yield DriverRequest(0, driver)
+    riders = 0
+    for time in range(scenario.duration):
+        for _ in range(_poisson(rng, scenario.rate(time))):
+            rider = Rider("r{}".format(riders),
+                          rng.randint(*scenario.patience),
+                          _place(rng, scenario), _place(rng, scenario))
+            riders += 1
+            yield RiderRequest(time, rider)
+
+
+def write_events(scenario: Scenario, filename: str) -> int:
+    """Write the events of <scenario> to <filename> as an event file, and
+    return the number of events written.
+
+    """
+    count = 0
+    with open(filename, "w") as file:
+        file.write("# Generated by scenario.py: grid {}, {} drivers, "
+                   "duration {}, seed {}\n".format(
+                       scenario.grid, scenario.drivers, scenario.duration,
+                       scenario.seed))
+        for event in generate(scenario):
+            if isinstance(event, DriverRequest):
+                driver = event.driver
+                file.write("{} DriverRequest {} {} {}\n".format(
+                    event.timestamp, driver.id, driver.location,
+                    driver.speed))
+            else:
+                rider = event.rider
+                file.write("{} RiderRequest {} {} {} {}\n".format(
+                    event.timestamp, rider.id, rider.origin,
+                    rider.destination, rider.patience))
+            count += 1
+    return count
+
+
+def _uniform(rng: random.Random, grid: int) -> Location:
+    """Return a location chosen uniformly from a <grid> by <grid> grid.
+
+    """
+    return Location(rng.randrange(grid), rng.randrange(grid))
+
+
+def _place(rng: random.Random, scenario: Scenario) -> Location:
+    """Return an origin or destination for a rider in <scenario>.
+
+    """
+    if not scenario.hotspots or rng.random() >= scenario.hotspot_share:
+        return _uniform(rng, scenario.grid)
+    row, column, spread = rng.choice(scenario.hotspots)
+    highest = scenario.grid - 1
+    return Location(min(max(round(rng.gauss(row, spread)), 0), highest),
+                    min(max(round(rng.gauss(column, spread)), 0), highest))
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    """Return a random number from the Poisson distribution with <mean>.
+
+    Large means are approximated by a normal distribution.
+    """
+    if mean <= 0:
+        return 0
+    if mean > 30:
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+    limit = math.exp(-mean)
+    count = 0
+    product = rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def _pair(text: str, kind: type) -> Tuple:
+    """Return the values in the comma- or colon-separated <text>, converted
+    to <kind>.
+
+    """
+    return tuple(kind(value) for value in text.replace(":", ",").split(","))
+
+
+def main() -> None:
+    """Write the event file described on the command line.
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic event file.")
+    parser.add_argument("filename")
+    parser.add_argument("--grid", type=int, default=100)
+    parser.add_argument("--drivers", type=int, default=100)
+    parser.add_argument("--duration", type=int, default=1000)
+    parser.add_argument("--rate", nargs="+", default=["0:1"],
+                        help="TIME:RATE points of the arrival rate curve")
+    parser.add_argument("--hotspot", action="append", default=[],
+                        help="ROW,COLUMN,SPREAD of a hotspot")
+    parser.add_argument("--hotspot-share", type=float, default=0.7)
+    parser.add_argument("--speeds", default="1,3", help="LOW,HIGH")
+    parser.add_argument("--patience", default="5,30", help="LOW,HIGH")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    scenario = Scenario(
+        args.grid, args.drivers, args.duration,
+        [(int(time), rate) for time, rate
+         in (_pair(point, float) for point in args.rate)],
+        [(int(row), int(column), spread) for row, column, spread
+         in (_pair(hotspot, float) for hotspot in args.hotspot)],
+        args.hotspot_share, _pair(args.speeds, int),
+        _pair(args.patience, int), args.seed)
+    count = write_events(scenario, args.filename)
+    print("Wrote {} events to {}".format(count, args.filename))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+"""A live dispatch service
+
+A DispatchService runs a Dispatcher as a long-lived asyncio service rather
+than inside an offline Simulation. Rider and driver requests arrive as they
+happen, and are timestamped with the service's clock, which counts units of
+simulated time since the service started. Pickups, dropoffs and
+cancellations are scheduled in an event queue just as in a Simulation, and
+a single timer task does each one when the clock reaches it. Every event is
+done by its own do() method, so the service behaves like a simulation whose
+requests happen to arrive in real time.
+
+Requests can be handed to the service in-process with submit(), or sent
+over a TCP connection, one line per request in the event file format. The
+timestamp at the start of each line is ignored. Run this module to start a
+service:
+
+    python service.py --port 8765 --time-scale 0.1
+
+and then send it requests, e.g. with netcat:
+
+    echo "0 DriverRequest Almond 1,1 1" | nc localhost 8765
+
+Each request is answered with one line: the id of the driver assigned to a
+rider or the rider assigned to a driver, or '-' if there is none yet. A
+line that is not a valid request, such as one of an unknown type or a
+driver whose speed is not positive, is answered with 'error: ' and the
+reason, and the connection stays open. Blank lines and comments are not
+answered. A driver only requests once: after each ride they are available
+again without another request.
+
+A timed event that fails is reported to the event loop's exception handler
+and counted in stats(), and the service carries on with the next one.
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional
+from container import HeapPriorityQueue
+from dispatcher import Dispatcher
+from event import Event, Pickup, DriverRequest, RiderRequest, parse_event, \
+    start_pickups
+from metrics import Histogram
+from monitor import Monitor, StreamingMonitor
+
+
+class DispatchService:
+    """A dispatcher that serves requests as they arrive, in real time.
+
+    Only one request or timed event is done at a time, on the event loop, so
+    the dispatcher never sees two at once. Timed events that are due are
+    always done before a new request, so the dispatcher sees everything in
+    timestamp order. A batch dispatcher matches its riders and drivers once
+    every unit of simulated time.
+    """
+
+    # === Private Attributes ===
+    _dispatcher: Dispatcher
+    #     The dispatcher that serves the requests.
+    _monitor: Monitor
+    #     The monitor that records the activities of riders and drivers.
+    _events: HeapPriorityQueue
+    #     The timed events that have been scheduled.
+    _time_scale: float
+    #     The number of seconds of real time in a unit of simulated time.
+    _started: Optional[float]
+    #     The event loop time at which the service started, or None if it
+    #     has not started.
+    _wakeup: Optional[asyncio.Event]
+    #     Set to wake the timer task up before the time it is waiting for.
+    _due: Optional[int]
+    #     The simulated time that the timer task is waiting for, or None if
+    #     it is waiting for a wakeup.
+    _timer: Optional[asyncio.Task]
+    #     The task that does timed events, or None if it is not running.
+    _latency: Histogram
+    #     How many microseconds each request took to handle.
+    _failures: int
+    #     The number of timed events that raised an error.
+
+    def __init__(self, dispatcher: Optional[Dispatcher] = None,
+                 monitor: Optional[Monitor] = None,
+                 time_scale: float = 1.0) -> None:
+        """Initialize a DispatchService that has not started.
+
+        dispatcher: A new dispatcher to serve the requests. A Dispatcher is
+            used if this is None. The monitor measures distances with the
+            dispatcher's distance model.
+        monitor: A new monitor to record the activities of riders and
+            drivers. A StreamingMonitor is used if this is None, so that
+            memory does not grow with every activity.
+        time_scale: The number of seconds of real time in a unit of
+            simulated time.
+
+        Precondition: time_scale > 0.
+        """
+        if dispatcher is None:
+            dispatcher = Dispatcher()
+        if monitor is None:
+            monitor = StreamingMonitor()
+        monitor.model = dispatcher.model
+        self._dispatcher = dispatcher
+        self._monitor = monitor
+        self._events = HeapPriorityQueue()
+        self._time_scale = time_scale
+        self._started = None
+        self._wakeup = None
+        self._due = None
+        self._timer = None
+        self._latency = Histogram()
+        self._failures = 0
+
+    def now(self) -> int:
+        """Return the current simulated time.
+
+        Precondition: the service has started.
+        """
+        elapsed = asyncio.get_running_loop().time() - self._started
+        return int(elapsed / self._time_scale)
+
+    async def start(self) -> None:
+        """Start the service's clock and its timer task.
+
+        """
+        self._started = asyncio.get_running_loop().time()
+        self._wakeup = asyncio.Event()
+        self._timer = asyncio.create_task(self._run_timers())
+
+    async def stop(self) -> None:
+        """Stop the timer task. Timed events that are not yet due are never
+        done.
+
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+
+    async def __aenter__(self) -> DispatchService:
+        """Start this service, to be stopped when the async with statement
+        ends.
+
+        """
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        """Stop this service.
+
+        """
+        await self.stop()
+
+    async def submit(self, request: Event) -> Optional[str]:
+        """Handle the RiderRequest or DriverRequest <request> now, and
+        return the id of the driver or rider assigned by it, if any.
+
+        Raise ValueError if <request> is not valid, as check_request()
+        decides.
+
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> async def demo():
+        ...     async with DispatchService(time_scale=0.01) as service:
+        ...         driver = Driver("Almond", Location(1, 1), 1)
+        ...         return await service.submit(DriverRequest(0, driver))
+        >>> asyncio.run(demo()) is None
+        True
+        """
+        check_request(request)
+        return self.handle(request)
+
+    def handle(self, request: Event) -> Optional[str]:
+        """Handle <request> as submit() does, without giving up control of
+        the event loop.
+
+        Precondition: the service has started.
+        """
+        started = time.perf_counter()
+        now = self.now()
+        self._advance(now)
+        request.timestamp = now
+        assigned = None
+        for event in self._do(request):
+            if isinstance(event, Pickup):
+                if isinstance(request, DriverRequest):
+                    assigned = event.rider.id
+                else:
+                    assigned = event.driver.id
+        self._latency.add((time.perf_counter() - started) * 1e6)
+        return assigned
+
+    async def serve(self, host: str = "127.0.0.1",
+                    port: int = 8765) -> asyncio.AbstractServer:
+        """Start accepting requests over TCP at <host> and <port>, and
+        return the server.
+
+        Precondition: the service has started.
+        """
+        return await asyncio.start_server(self._serve_client, host, port)
+
+    def stats(self) -> Dict[str, float]:
+        """Return the number of requests that have been handled,
+        percentiles of the microseconds it took to handle them, and the
+        number of timed events that failed.
+
+        """
+        latency = self._latency
+        return {"requests": len(latency),
+                "failed_events": self._failures,
+                "latency_p50_us": latency.percentile(50),
+                "latency_p99_us": latency.percentile(99),
+                "latency_max_us": latency.percentile(100)}
+
+    def report(self) -> Dict[str, float]:
+        """Return the monitor's report of the activities so far.
+
+        """
+        return self._monitor.report()
+
+    async def _serve_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+        """Handle each request sent on a connection, and answer it, until
+        the client closes the connection.
+
+        """
+        try:
+            async for line in reader:
+                try:
+                    text = line.decode("utf-8").strip()
+                    if not text or text.startswith("#"):
+                        continue
+                    request = parse_event(text)
+                    if request is None:
+                        raise ValueError("unknown request type")
+                    check_request(request)
+                    assigned = self.handle(request)
+                except (ValueError, IndexError) as error:
+                    reply = "error: {}".format(error)
+                else:
+                    reply = "-" if assigned is None else assigned
+                writer.write(reply.encode("utf-8") + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _run_timers(self) -> None:
+        """Do each timed event when the clock reaches it, until cancelled.
+
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            now = self.now()
+            self._advance(now)
+            if self._dispatcher.batch:
+                for event in start_pickups(now, self._dispatcher.match()):
+                    self._schedule(event)
+                self._advance(now)
+            due = None if self._events.is_empty() \
+                else self._events.peek().timestamp
+            if self._dispatcher.batch and self._dispatcher.waiting_list \
+                    and (due is None or due > now + 1):
+                due = now + 1
+            self._due = due
+            self._wakeup.clear()
+            timeout = None if due is None else max(
+                0.0, self._started + due * self._time_scale - loop.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _advance(self, now: int) -> None:
+        """Do every timed event that is due at or before <now>.
+
+        An event that raises an error is reported to the event loop's
+        exception handler, so that it cannot stop the timer task or fail an
+        unrelated request.
+        """
+        events = self._events
+        while not events.is_empty() and events.peek().timestamp <= now:
+            event = events.remove()
+            try:
+                self._do(event)
+            except Exception as error:
+                self._failures += 1
+                asyncio.get_running_loop().call_exception_handler({
+                    "message": "timed event failed: {}".format(event),
+                    "exception": error})
+
+    def _do(self, event: Event) -> List[Event]:
+        """Do <event>, schedule the events that it returns, and return them.
+
+        """
+        new_events = event.do(self._dispatcher, self._monitor) or []
+        for new_event in new_events:
+            self._schedule(new_event)
+        for stale in event.stale_events():
+            self._events.discard(stale)
+        return new_events
+
+    def _schedule(self, event: Event) -> None:
+        """Add <event> to the timed events, and wake the timer task if it is
+        due before the time the task is waiting for.
+
+        """
+        self._events.add(event)
+        if self._wakeup is not None \
+                and (self._due is None or event.timestamp < self._due):
+            self._due = event.timestamp
+            self._wakeup.set()
+
+
+def check_request(request: Event) -> None:
+    """Raise ValueError if <request> is a DriverRequest whose driver's
+    speed is not positive, or a RiderRequest whose rider's patience is
+    negative.
+
+    >>> from driver import Driver
+    >>> from location import Location
+    >>> check_request(DriverRequest(0, Driver("Almond", Location(1, 1), 0)))
+    Traceback (most recent call last):
+    ValueError: speed must be positive
+    """
+    if isinstance(request, DriverRequest) and request.driver.speed <= 0:
+        raise ValueError("speed must be positive")
+    if isinstance(request, RiderRequest) and request.rider.patience < 0:
+        raise ValueError("patience must not be negative")
+
+
+def main() -> None:
+    """Run a dispatch service on the port named on the command line until
+    interrupted.
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Serve rider and driver requests over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="seconds of real time per unit of simulated "
+                             "time")
+    parser.add_argument("--batch", action="store_true",
+                        help="match riders and drivers in batches")
+    args = parser.parse_args()
+
+    async def run() -> None:
+        """Serve requests until cancelled.
+
+        """
+        service = DispatchService(Dispatcher(batch=args.batch),
+                                  time_scale=args.time_scale)
+        async with service:
+            server = await service.serve(args.host, args.port)
+            async with server:
+                await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,17 @@
 """Starting point for simulation"""
 
-from typing import List, Dict
-from container import PriorityQueue
+from __future__ import annotations
+from itertools import islice
+from typing import Dict, Iterable, Optional, TYPE_CHECKING
+import checkpoint
+from container import Container, HeapPriorityQueue
 from dispatcher import Dispatcher
-from event import Event, create_event_list
+from event import Event, EventPool, iter_events, start_pickups
 from monitor import Monitor
+from profiling import Profiler
+
+if TYPE_CHECKING:
+    from tracelog import Tracer
 
 
 class Simulation:
@@ -26,46 +33,253 @@ class Simulation:
     """
 
     # === Private Attributes ===
-    _events: PriorityQueue
+    _events: Container
     #     A sequence of events arranged in priority determined by the event
     #     sorting order.
     _dispatcher: Dispatcher
     #     The dispatcher associated with the simulation.
     _monitor: Monitor
     #     The monitor associated with the simulation.
+    _profiler: Optional[Profiler]
+    #     The profiler that records where the time goes in each run, or None
+    #     if runs are not profiled.
+    _checkpoint_file: Optional[str]
+    #     The file to save checkpoints to, or None if none are saved.
+    _checkpoint_interval: int
+    #     The simulated time between checkpoints.
+    _next_checkpoint: int
+    #     The simulated time at which the next checkpoint is due.
+    _consumed: int
+    #     The number of initial events that had been taken when the last
+    #     checkpoint was saved.
+    _pending: Optional[Event]
+    #     The initial event that had been taken but not yet done when the
+    #     last checkpoint was saved, if any.
+    _pool: Optional[EventPool]
+    #     The pool that done events are released into for reuse, or None if
+    #     events are not reused.
+    _trace: Optional[Tracer]
+    #     The tracer that is told about each event done, or None if runs are
+    #     not traced.
 
-    def __init__(self) -> None:
+    def __init__(self, events: Optional[Container] = None,
+                 monitor: Optional[Monitor] = None,
+                 dispatcher: Optional[Dispatcher] = None,
+                 profiler: Optional[Profiler] = None,
+                 checkpoint_file: Optional[str] = None,
+                 checkpoint_interval: int = 3600,
+                 pool: Optional[EventPool] = None,
+                 trace: Optional[Tracer] = None) -> None:
         """Initialize a Simulation.
 
+        events: An empty container to use as the event queue, such as a
+            CalendarQueue. A HeapPriorityQueue is used if this is None.
+        monitor: A new monitor to record the simulation, such as a
+            StreamingMonitor. A Monitor is used if this is None.
+        dispatcher: A new dispatcher for the simulation. A Dispatcher is
+            used if this is None. The monitor measures distances with the
+            dispatcher's distance model.
+        profiler: A profiler to record where the time goes in each run.
+            Runs are not profiled if this is None.
+        checkpoint_file: A file to save a checkpoint to, every
+            <checkpoint_interval> units of simulated time, from which the
+            run can be resumed with resume(). No checkpoints are saved if
+            this is None. A profiled run cannot be checkpointed.
+        pool: A pool to take new events from, and to release each event
+            into once it has been done, so that the objects are reused
+            rather than allocated anew. The simulation then owns its initial
+            events: once done, they may be reused for other events. Events
+            are not reused if this is None.
+        trace: A tracer, such as a tracelog.TraceWriter, to tell about each
+            event done and whom the dispatcher chose for it. Runs are not
+            traced if this is None.
+
+        Precondition: checkpoint_interval > 0.
         """
-        self._events = PriorityQueue()
-        self._dispatcher = Dispatcher()
-        self._monitor = Monitor()
+        if profiler is not None and checkpoint_file is not None:
+            raise ValueError("a profiled run cannot be checkpointed")
+        if events is None:
+            events = HeapPriorityQueue()
+        if monitor is None:
+            monitor = Monitor()
+        if dispatcher is None:
+            dispatcher = Dispatcher()
+        monitor.model = dispatcher.model
+        self._events = events
+        self._dispatcher = dispatcher
+        self._monitor = monitor
+        self._profiler = profiler
+        self._checkpoint_file = checkpoint_file
+        self._checkpoint_interval = checkpoint_interval
+        self._next_checkpoint = checkpoint_interval
+        self._consumed = 0
+        self._pending = None
+        self._pool = pool
+        self._trace = trace
 
-    def run(self, initial_events: List[Event]) -> Dict[str, float]:
-        """Run the simulation on the list of events in <initial_events>.
+    def run(self, initial_events: Iterable[Event]) -> Dict[str, float]:
+        """Run the simulation on the events in <initial_events>.
 
         Return a dictionary containing statistics of the simulation,
         according to the specifications in the assignment handout.
 
-        initial_events: An initial list of events.
+        initial_events: The initial events. If this is a list, the events
+            may be in any order. Otherwise it must yield events in timestamp
+            order, and each event is only taken from it once the simulation
+            reaches that event's timestamp, so an iterator such as
+            iter_events() never has to hold the whole event file in memory.
+
+        If the dispatcher is a batch dispatcher, its waiting riders are
+        matched with its idle drivers each time the last event with a given
+        timestamp has been done.
+
+        If this simulation was resumed from a checkpoint, <initial_events>
+        must be the same initial events as those of the run that saved it.
+        The ones that had already been taken are skipped.
         """
-        for event in initial_events:
-            self._events.add(event)
+        profiler = self._profiler
+        batch = self._dispatcher.batch
+        pool = self._pool
+        reuse = pool is not None
+        if pool is None:
+            # A pool that nothing is released into gives out new events.
+            pool = EventPool()
+        trace = self._trace
+        if profiler is not None:
+            profiler.start(self._dispatcher, self._monitor, self._events)
+        schedule = self._events.add
+        if trace is not None:
+            schedule = trace.scheduler(schedule)
+        saving = self._checkpoint_file is not None
+        try:
+            inputs = iter(initial_events)
+            consumed = self._consumed
+            if consumed > 0:
+                inputs = islice(inputs, consumed, None)
+                pending = self._pending
+            else:
+                if isinstance(initial_events, list):
+                    # Add all initial events to the event queue.
+                    self._events.add_all(initial_events)
+                    consumed = len(initial_events)
+                    inputs = iter([])
+                pending = next(inputs, None)
+                if pending is not None:
+                    consumed += 1
+
+            while pending is not None or not self._events.is_empty():
+                if saving and self._next_timestamp(pending) \
+                        >= self._next_checkpoint:
+                    self._save_checkpoint(pending, consumed)
+                # An initial event goes ahead of queued events with the same
+                # timestamp, as it would have if it had been queued first.
+                if pending is not None and (
+                        self._events.is_empty()
+                        or pending.timestamp <= self._events.peek().timestamp):
+                    curr_event = pending
+                    pending = next(inputs, None)
+                    if pending is not None:
+                        consumed += 1
+                else:
+                    curr_event = self._events.remove()
+                if profiler is None:
+                    curr_event.do_into(self._dispatcher, self._monitor,
+                                       schedule, pool)
+                else:
+                    new_events = profiler.do(curr_event, self._dispatcher,
+                                             self._monitor)
+                    if new_events is not None:
+                        for event in new_events:
+                            schedule(event)
+                # Stale events are still in the queue, so they are never
+                # released.
+                for event in curr_event.stale_events():
+                    self._events.discard(event)
+                if trace is not None:
+                    trace.record(curr_event, self._events)
+                if batch and self._tick_ended(curr_event.timestamp, pending):
+                    matches = self._dispatcher.match()
+                    for event in start_pickups(curr_event.timestamp, matches):
+                        self._events.add(event)
+                    if trace is not None:
+                        trace.record_matches(curr_event.timestamp, matches,
+                                             self._events)
+                if reuse:
+                    pool.release(curr_event)
+            # Until there are no more events, remove an event
+            # from the event queue and do it. Add any returned
+            # events to the event queue.
 
-        # Add all initial events to the event queue.
+            return self._monitor.report()
+        finally:
+            if profiler is not None:
+                profiler.stop()
 
-        while not self._events.is_empty():
-            curr_event = self._events.remove()
-            new_events = curr_event.do(self._dispatcher, self._monitor)
-            if new_events is not None:
-                for event in new_events:
-                    self._events.add(event)
-        # Until there are no more events, remove an event
-        # from the event queue and do it. Add any returned
-        # events to the event queue.
+    def _next_timestamp(self, pending: Optional[Event]) -> int:
+        """Return the timestamp of the next event to be done: the earlier of
+        the next initial event <pending> and the first event in the queue.
 
-        return self._monitor.report()
+        Precondition: <pending> is not None or the event queue is not empty.
+        """
+        if self._events.is_empty():
+            return pending.timestamp
+        timestamp = self._events.peek().timestamp
+        if pending is not None and pending.timestamp < timestamp:
+            return pending.timestamp
+        return timestamp
+
+    def _save_checkpoint(self, pending: Optional[Event],
+                         consumed: int) -> None:
+        """Save this simulation to its checkpoint file, given that
+        <consumed> initial events have been taken and <pending> is the one
+        that is next to be done.
+
+        """
+        self._pending = pending
+        self._consumed = consumed
+        interval = self._checkpoint_interval
+        self._next_checkpoint = \
+            (self._next_timestamp(pending) // interval + 1) * interval
+        checkpoint.save(self, self._checkpoint_file)
+        self._pending = None
+
+    def _tick_ended(self, timestamp: int, pending: Optional[Event]) -> bool:
+        """Return True iff no event with <timestamp> is left, either in the
+        event queue or as the next initial event <pending>.
+
+        """
+        if pending is not None and pending.timestamp <= timestamp:
+            return False
+        return self._events.is_empty() \
+            or self._events.peek().timestamp > timestamp
+
+
+def resume(filename: str, checkpoint_file: Optional[str] = None,
+           trace_file: Optional[str] = None) -> Simulation:
+    """Return the simulation saved in the checkpoint file <filename>, ready
+    to be run again on the same initial events.
+
+    checkpoint_file: A file for the resumed simulation to save its
+        checkpoints to instead of the one it used before, e.g. so that a
+        what-if run forked from a checkpoint does not overwrite it.
+    trace_file: A file for a traced simulation to carry on its trace in,
+        starting from a copy of the trace up to the checkpoint. If this is
+        None, the original trace is cut back to the checkpoint and carried
+        on in, which is only allowed if <checkpoint_file> is None too, so
+        that a forked run never cuts short the trace of the run it was
+        forked from.
+
+    Raise ValueError if a traced simulation is given a <checkpoint_file>
+    but no <trace_file>.
+    """
+    simulation = checkpoint.load(filename)
+    if simulation._trace is not None:
+        if checkpoint_file is not None and trace_file is None:
+            raise ValueError("a forked run needs its own trace file")
+        simulation._trace.reopen(trace_file)
+    if checkpoint_file is not None:
+        simulation._checkpoint_file = checkpoint_file
+    return simulation
 
 
 if __name__ == "__main__":
@@ -73,9 +287,10 @@ if __name__ == "__main__":
     python_ta.check_all(
         config={
             'extra-imports': ['typing', 'container', 'dispatcher', 'event',
-                              'monitor']})
+                              'monitor', 'profiling', 'itertools',
+                              'checkpoint', 'tracelog']})
 
-    events = create_event_list("events.txt")
+    events = iter_events("events.txt")
     sim = Simulation()
     final_stats = sim.run(events)
     print(final_stats)
@@ -0,0 +1,160 @@
+"""Parameter sweeps over many simulations
+
+A sweep runs one independent Simulation for every combination of scenario
+parameters, spread across a pool of worker processes, and collects their
+reports into a single table. For example,
+
+    python sweep.py --events events.txt --fleet-size 2 4 6 --speed 1 2
+
+runs six simulations and prints one CSV row for each. The parameters are:
+
+    events      the event file to simulate, either a text event file or a
+                binary event log ending in '.bin'
+    fleet_size  only the first this many drivers in the file take part
+    speed       every driver drives at this speed
+    patience    every rider has this patience
+    queue       the event queue: 'heap' or 'calendar'
+
+Every parameter except events is optional, and a missing or None parameter
+leaves the events in the file as they are.
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional
+from container import CalendarQueue, HeapPriorityQueue
+from event import Event, DriverRequest, RiderRequest, iter_events
+from eventlog import EventLog
+from simulation import Simulation
+
+
+QUEUES = {
+    "heap": HeapPriorityQueue,
+    "calendar": CalendarQueue,
+}
+
+
+def expand(grid: Dict[str, List[object]]) -> List[Dict[str, object]]:
+    """Return one scenario for every combination of the values in <grid>.
+
+    >>> expand({"events": ["events.txt"], "speed": [1, 2]})
+    ... # doctest: +NORMALIZE_WHITESPACE
+    [{'events': 'events.txt', 'speed': 1},
+     {'events': 'events.txt', 'speed': 2}]
+    """
+    names = list(grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+def scenario_events(scenario: Dict[str, object]) -> Iterator[Event]:
+    """Yield the initial events of <scenario>, in timestamp order.
+
+    The event file is closed once every event has been taken, or as soon
+    as this generator is closed.
+    """
+    filename = scenario["events"]
+    fleet_size = scenario.get("fleet_size")
+    speed = scenario.get("speed")
+    patience = scenario.get("patience")
+    if filename.endswith(".bin"):
+        events = EventLog(filename)
+    else:
+        events = iter_events(filename)
+    drivers = 0
+    try:
+        for event in events:
+            if isinstance(event, DriverRequest):
+                drivers += 1
+                if fleet_size is not None and drivers > fleet_size:
+                    continue
+                if speed is not None:
+                    event.driver.speed = speed
+            elif isinstance(event, RiderRequest) and patience is not None:
+                event.rider.patience = patience
+            yield event
+    finally:
+        events.close()
+
+
+def run_scenario(scenario: Dict[str, object]) -> Dict[str, object]:
+    """Run a simulation of <scenario>, and return the scenario's parameters
+    together with the simulation's report.
+
+    If the report cannot be made, because no rider finished waiting or no
+    driver took part, the row has an 'error' instead.
+    """
+    row = dict(scenario)
+    simulation = Simulation(QUEUES[scenario.get("queue") or "heap"]())
+    try:
+        row.update(simulation.run(scenario_events(scenario)))
+    except ZeroDivisionError:
+        row["error"] = "nothing to report"
+    return row
+
+
+def sweep(scenarios: Iterable[Dict[str, object]],
+          workers: Optional[int] = None) -> List[Dict[str, object]]:
+    """Run every scenario in <scenarios> in a pool of <workers> processes,
+    and return their rows in the same order as <scenarios>.
+
+    Each scenario is a separate task that the next free worker picks up, so
+    a few long scenarios never hold up the rest. The scenarios with the
+    biggest event files are started first, so that the longest ones do not
+    end up running alone at the end of the sweep.
+    """
+    scenarios = list(scenarios)
+    order = sorted(range(len(scenarios)),
+                   key=lambda i: -os.path.getsize(scenarios[i]["events"]))
+    rows = [None] * len(scenarios)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_scenario, scenarios[i]): i
+                   for i in order}
+        for future in as_completed(futures):
+            rows[futures[future]] = future.result()
+    return rows
+
+
+def write_table(rows: List[Dict[str, object]], file: object) -> None:
+    """Write <rows> to <file> as CSV, with a column for every key that
+    appears in any row.
+
+    """
+    columns = []
+    for row in rows:
+        columns.extend(key for key in row if key not in columns)
+    writer = csv.DictWriter(file, columns, restval="")
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def main() -> None:
+    """Run the sweep described on the command line, and print its table.
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Run a simulation for every combination of parameters.")
+    parser.add_argument("--events", nargs="+", required=True)
+    parser.add_argument("--fleet-size", type=int, nargs="+", default=[None])
+    parser.add_argument("--speed", type=int, nargs="+", default=[None])
+    parser.add_argument("--patience", type=int, nargs="+", default=[None])
+    parser.add_argument("--queue", choices=sorted(QUEUES), nargs="+",
+                        default=["heap"])
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    scenarios = expand({"events": args.events,
+                        "fleet_size": args.fleet_size,
+                        "speed": args.speed,
+                        "patience": args.patience,
+                        "queue": args.queue})
+    write_table(sweep(scenarios, args.workers), sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,544 @@
+"""Traces of dispatcher decisions
+
+A trace records every event that a simulation does, in the order it does
+them, along with whom the dispatcher chose for it and how many events were
+left queued afterwards. Give a TraceWriter to a Simulation to record one:
+
+    with TraceWriter("run.trace") as trace:
+        Simulation(trace=trace).run(iter_events("events.txt"))
+
+A run can then be replayed against a changed dispatcher, and compared with
+the trace record by record, to find the first point at which the two runs
+differ. Run this module to record or replay a trace of an event file:
+
+    python tracelog.py record events.txt run.trace
+    python tracelog.py replay events.txt run.trace
+
+A trace file is written append-only, through a buffer:
+
+    header     magic b'TRCE' and format version
+    records    one per event done, or per rider matched by a batch
+               dispatcher, in the order they happened
+
+Each record starts with its kind. An id record holds the length and UTF-8
+bytes of a rider or driver id, and gives it the next id number; it comes
+just before the first record that uses the id. Every other record holds a
+timestamp, the id number of its rider or driver, the id number of the
+driver or rider chosen for them, or NONE if there was none, and the queue
+depth. For a RiderRequest, the chosen one is the driver assigned to the
+rider; for a DriverRequest, the rider assigned to the driver; and for a
+Pickup, Dropoff or match, the driver of the rider.
+"""
+
+from __future__ import annotations
+import argparse
+import functools
+import mmap
+import struct
+import sys
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, \
+    Optional, Tuple
+from container import Container
+from dispatcher import Dispatcher
+from driver import Driver
+from event import Event, RiderRequest, DriverRequest, Cancellation, Pickup, \
+    Dropoff, iter_events
+from rider import Rider
+from simulation import Simulation
+
+
+MAGIC = b'TRCE'
+VERSION = 1
+
+KINDS = ("RiderRequest", "DriverRequest", "Cancellation", "Pickup",
+         "Dropoff", "Match")
+RIDER_REQUEST = 0
+DRIVER_REQUEST = 1
+CANCELLATION = 2
+PICKUP = 3
+DROPOFF = 4
+MATCH = 5
+ID = 255
+NONE = 0xFFFFFFFF
+
+_HEADER = struct.Struct('<4sH')
+_RECORD = struct.Struct('<BqIII')
+_ID = struct.Struct('<BI')
+_FIELDS = 5
+
+_CODES = {RiderRequest: RIDER_REQUEST, DriverRequest: DRIVER_REQUEST,
+          Cancellation: CANCELLATION, Pickup: PICKUP, Dropoff: DROPOFF}
+
+# A record as it is read back: (kind, timestamp, rider or driver id, chosen
+# id or None, queue depth).
+Record = Tuple[str, int, str, Optional[str], int]
+
+
+class Divergence(Exception):
+    """A replayed run did something different from the run it traced.
+
+    === Attributes ===
+    index: The position of the first record that differs.
+    recorded: That record in the trace, or None if the trace ended first.
+    replayed: What the replayed run did instead, or None if it ended first.
+    """
+
+    index: int
+    recorded: Optional[Record]
+    replayed: Optional[Record]
+
+    def __init__(self, index: int, recorded: Optional[Record],
+                 replayed: Optional[Record]) -> None:
+        """Initialize a Divergence at record <index>.
+
+        """
+        super().__init__(index, recorded, replayed)
+        self.index = index
+        self.recorded = recorded
+        self.replayed = replayed
+
+    def __str__(self) -> str:
+        """Return a description of where and how the runs differ.
+
+        """
+        return "first divergence at record {}:\n  recorded: {}\n" \
+               "  replayed: {}".format(self.index,
+                                       _describe(self.recorded),
+                                       _describe(self.replayed))
+
+
+class Tracer:
+    """Something that is told about each event a simulation does, and each
+    rider that a batch dispatcher matches.
+
+    This class is abstract; subclasses must implement _write().
+    """
+
+    # === Private Attributes ===
+    _pickup: Optional[Pickup]
+    #     The Pickup spawned by the event being done, if any.
+
+    def __init__(self) -> None:
+        """Initialize a Tracer.
+
+        """
+        self._pickup = None
+
+    def scheduler(self, schedule: Callable[[Event], None]
+                  ) -> Callable[[Event], None]:
+        """Return a function that passes each new event to <schedule>, and
+        notes any Pickup among them, which shows whom the dispatcher chose.
+
+        """
+        def traced(event: Event) -> None:
+            """Note <event> if it is a Pickup, and schedule it.
+
+            """
+            if type(event) is Pickup:
+                self._pickup = event
+            schedule(event)
+        return traced
+
+    def record(self, event: Event, events: Container) -> None:
+        """Record that <event> has been done, leaving <events> queued.
+
+        """
+        kind = _CODES[type(event)]
+        pickup = self._pickup
+        self._pickup = None
+        if kind == DRIVER_REQUEST:
+            subject = event.driver.id
+            chosen = None if pickup is None else pickup.rider.id
+        else:
+            subject = event.rider.id
+            if kind == RIDER_REQUEST:
+                chosen = None if pickup is None else pickup.driver.id
+            elif kind == CANCELLATION:
+                chosen = None
+            else:
+                chosen = event.driver.id
+        self._write(kind, event.timestamp, subject, chosen, len(events))
+
+    def record_matches(self, timestamp: int,
+                       matches: List[Tuple[Rider, Driver]],
+                       events: Container) -> None:
+        """Record that a batch dispatcher has matched the riders and drivers
+        in <matches> at <timestamp>, leaving <events> queued.
+
+        """
+        depth = len(events)
+        for rider, driver in matches:
+            self._write(MATCH, timestamp, rider.id, driver.id, depth)
+
+    def reopen(self, filename: Optional[str] = None) -> None:
+        """Get ready to carry on recording after being restored from a
+        checkpoint, in <filename> if the tracer writes to a file.
+
+        """
+
+    def _write(self, kind: int, timestamp: int, subject: str,
+               chosen: Optional[str], depth: int) -> None:
+        """Record one record.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+
+class TraceWriter(Tracer):
+    """A tracer that appends each record to a trace file.
+
+    Records are collected in a buffer of plain integers, and packed and
+    written to the file in a single call whenever the buffer fills up, and
+    when the writer is closed. The id records for the ids that first appear
+    in a batch are written just before it.
+
+    A simulation that saves checkpoints can be traced. The checkpoint holds
+    how far the trace had been written, and the restored writer is detached
+    from any file until reopen() is called, so loading a checkpoint never
+    changes a trace. Simulation.resume() reopens it.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "run.trace")
+    >>> with TraceWriter(path) as trace:
+    ...     _ = Simulation(trace=trace).run(iter_events("events.txt"))
+    >>> for record in list(read_trace(path))[6:8]:
+    ...     print(_describe(record))
+    0 RiderRequest Almond -> Amaranth (depth 2)
+    0 Pickup Almond -> Amaranth (depth 1)
+    """
+
+    # === Private Attributes ===
+    _filename: str
+    #     The name of the trace file.
+    _file: Optional[BinaryIO]
+    #     The open trace file, or None if this writer has been restored from
+    #     a checkpoint and not reopened yet.
+    _offset: int
+    #     The number of bytes of the trace that have been written to the
+    #     file.
+    _ids: Dict[str, int]
+    #     The id number of every id that has been written.
+    _fields: List[int]
+    #     The fields of each record that has not been written yet, in order.
+    _new_ids: List[bytes]
+    #     The id records for the ids first used by the records in _fields.
+    _limit: int
+    #     The number of fields to collect before writing them.
+
+    def __init__(self, filename: str, batch: int = 4096) -> None:
+        """Initialize a TraceWriter that writes a new trace to <filename>,
+        <batch> records at a time.
+
+        Precondition: batch > 0.
+        """
+        Tracer.__init__(self)
+        self._filename = filename
+        self._file = open(filename, "wb", buffering=0)
+        self._file.write(_HEADER.pack(MAGIC, VERSION))
+        self._offset = _HEADER.size
+        self._ids = {}
+        self._fields = []
+        self._new_ids = []
+        self._limit = batch * _FIELDS
+
+    def __enter__(self) -> TraceWriter:
+        """Return this writer, to be closed when the with statement ends.
+
+        """
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close this writer.
+
+        """
+        self.close()
+
+    def __getstate__(self) -> Dict[str, object]:
+        """Return the state of this writer for pickling: its file name, how
+        much of the trace has been written, and the id numbers.
+
+        """
+        self.flush()
+        return {"filename": self._filename, "offset": self._offset,
+                "ids": dict(self._ids), "limit": self._limit}
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        """Restore this writer without opening its trace file.
+
+        """
+        Tracer.__init__(self)
+        self._filename = state["filename"]
+        self._file = None
+        self._offset = state["offset"]
+        self._ids = state["ids"]
+        self._fields = []
+        self._new_ids = []
+        self._limit = state["limit"]
+
+    def reopen(self, filename: Optional[str] = None) -> None:
+        """Reopen a writer that was restored from a checkpoint, so that it
+        carries on from the point the checkpoint was saved at.
+
+        filename: A new trace file to carry on in. It starts with a copy of
+            the trace up to the checkpoint, and the original trace is left
+            as it is. If this is None, the original trace file is cut back
+            to the checkpoint and carried on in.
+        """
+        if filename is None or filename == self._filename:
+            self._file = open(self._filename, "r+b", buffering=0)
+            self._file.truncate(self._offset)
+            self._file.seek(self._offset)
+            return
+        with open(self._filename, "rb") as original:
+            prefix = original.read(self._offset)
+        if len(prefix) < self._offset:
+            raise ValueError("{} is shorter than the checkpoint".format(
+                self._filename))
+        self._filename = filename
+        self._file = open(filename, "wb", buffering=0)
+        self._file.write(prefix)
+
+    def flush(self) -> None:
+        """Write the buffered records to the trace file.
+
+        Raise ValueError if this writer has not been reopened since it was
+        restored from a checkpoint.
+        """
+        fields = self._fields
+        if not fields:
+            return
+        if self._file is None:
+            raise ValueError("a restored TraceWriter must be reopened")
+        records = _batch_struct(len(fields) // _FIELDS).pack(*fields)
+        data = b"".join(self._new_ids) + records
+        self._file.write(data)
+        self._offset += len(data)
+        fields.clear()
+        self._new_ids.clear()
+
+    def close(self) -> None:
+        """Write out anything still buffered and close the trace file.
+
+        """
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def record(self, event: Event, events: Container) -> None:
+        """Record that <event> has been done, leaving <events> queued.
+
+        This does the same as Tracer.record, without the call to _write(),
+        since it is done for every event.
+        """
+        kind = _CODES[type(event)]
+        pickup = self._pickup
+        ids = self._ids
+        if kind == DRIVER_REQUEST:
+            number = ids.get(event.driver.id)
+            if number is None:
+                number = self._new_id(event.driver.id)
+            chosen = None if pickup is None else pickup.rider.id
+        else:
+            number = ids.get(event.rider.id)
+            if number is None:
+                number = self._new_id(event.rider.id)
+            if kind == RIDER_REQUEST:
+                chosen = None if pickup is None else pickup.driver.id
+            elif kind == CANCELLATION:
+                chosen = None
+            else:
+                chosen = event.driver.id
+        if chosen is None:
+            chosen_number = NONE
+        else:
+            chosen_number = ids.get(chosen)
+            if chosen_number is None:
+                chosen_number = self._new_id(chosen)
+        self._pickup = None
+        fields = self._fields
+        fields += (kind, event.timestamp, number, chosen_number, len(events))
+        if len(fields) >= self._limit:
+            self.flush()
+
+    def _write(self, kind: int, timestamp: int, subject: str,
+               chosen: Optional[str], depth: int) -> None:
+        """Append one record, after the id records for any ids that are
+        new.
+
+        """
+        ids = self._ids
+        number = ids.get(subject)
+        if number is None:
+            number = self._new_id(subject)
+        if chosen is None:
+            chosen_number = NONE
+        else:
+            chosen_number = ids.get(chosen)
+            if chosen_number is None:
+                chosen_number = self._new_id(chosen)
+        fields = self._fields
+        fields += (kind, timestamp, number, chosen_number, depth)
+        if len(fields) >= self._limit:
+            self.flush()
+
+    def _new_id(self, identifier: str) -> int:
+        """Append an id record for <identifier>, and return its number.
+
+        """
+        data = identifier.encode("utf-8")
+        self._new_ids.append(_ID.pack(ID, len(data)) + data)
+        number = self._ids[identifier] = len(self._ids)
+        return number
+
+
+class TraceChecker(Tracer):
+    """A tracer that compares each record with the next one in a trace file,
+    and raises Divergence at the first that differs.
+
+    """
+
+    # === Private Attributes ===
+    _records: Iterator[Record]
+    #     The records of the trace that have not been compared yet.
+    _index: int
+    #     The number of records that have been compared.
+
+    def __init__(self, filename: str) -> None:
+        """Initialize a TraceChecker that compares with the trace in
+        <filename>.
+
+        """
+        Tracer.__init__(self)
+        self._records = read_trace(filename)
+        self._index = 0
+
+    def __len__(self) -> int:
+        """Return the number of records that have matched so far.
+
+        """
+        return self._index
+
+    def finish(self) -> None:
+        """Raise Divergence if the trace has records left over.
+
+        """
+        recorded = next(self._records, None)
+        if recorded is not None:
+            raise Divergence(self._index, recorded, None)
+
+    def _write(self, kind: int, timestamp: int, subject: str,
+               chosen: Optional[str], depth: int) -> None:
+        """Compare one record with the next one in the trace.
+
+        """
+        replayed = (KINDS[kind], timestamp, subject, chosen, depth)
+        recorded = next(self._records, None)
+        if recorded != replayed:
+            raise Divergence(self._index, recorded, replayed)
+        self._index += 1
+
+
+@functools.lru_cache(maxsize=8)
+def _batch_struct(count: int) -> struct.Struct:
+    """Return the format of <count> records in a row.
+
+    """
+    return struct.Struct("<" + _RECORD.format[1:] * count)
+
+
+def read_trace(filename: str) -> Iterator[Record]:
+    """Yield the records in the trace file <filename>, in order.
+
+    Raise ValueError if the file is not a trace file.
+    """
+    with open(filename, "rb") as file:
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size \
+                or _HEADER.unpack(header) != (MAGIC, VERSION):
+            raise ValueError("{} is not a version {} trace file".format(
+                filename, VERSION))
+        if file.seek(0, 2) == _HEADER.size:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            ids = []
+            offset = _HEADER.size
+            end = len(data)
+            unpack = _RECORD.unpack_from
+            while offset < end:
+                if data[offset] == ID:
+                    _, length = _ID.unpack_from(data, offset)
+                    offset += _ID.size
+                    ids.append(data[offset:offset + length].decode("utf-8"))
+                    offset += length
+                    continue
+                kind, timestamp, subject, chosen, depth = unpack(data, offset)
+                offset += _RECORD.size
+                yield (KINDS[kind], timestamp, ids[subject],
+                       None if chosen == NONE else ids[chosen], depth)
+
+
+def replay(events: Iterable[Event], filename: str,
+           dispatcher: Optional[Dispatcher] = None
+           ) -> Tuple[int, Optional[Divergence]]:
+    """Simulate <events> with <dispatcher>, comparing the run with the trace
+    in <filename>, and return the number of records that matched, along
+    with the first divergence, or None if the runs were the same.
+
+    dispatcher: A new dispatcher to replay with. A Dispatcher is used if
+        this is None.
+
+    <events> must be the initial events of the traced run, given in the same
+    way: a list of initial events is queued all at once, which changes the
+    queue depths.
+    """
+    checker = TraceChecker(filename)
+    try:
+        Simulation(dispatcher=dispatcher, trace=checker).run(events)
+        checker.finish()
+    except Divergence as divergence:
+        return len(checker), divergence
+    return len(checker), None
+
+
+def _describe(record: Optional[Record]) -> str:
+    """Return a readable form of <record>.
+
+    """
+    if record is None:
+        return "(end of run)"
+    kind, timestamp, subject, chosen, depth = record
+    return "{} {} {} -> {} (depth {})".format(
+        timestamp, kind, subject, "-" if chosen is None else chosen, depth)
+
+
+def main() -> None:
+    """Record or replay the trace named on the command line.
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Record and replay traces of dispatcher decisions.")
+    parser.add_argument("command", choices=["record", "replay"])
+    parser.add_argument("events", help="a text event file")
+    parser.add_argument("trace", help="the trace file")
+    parser.add_argument("--batch", action="store_true",
+                        help="use a batch dispatcher")
+    args = parser.parse_args()
+
+    dispatcher = Dispatcher(batch=args.batch)
+    if args.command == "record":
+        with TraceWriter(args.trace) as trace:
+            Simulation(dispatcher=dispatcher, trace=trace).run(
+                iter_events(args.events))
+        return
+    matched, divergence = replay(iter_events(args.events), args.trace,
+                                 dispatcher)
+    if divergence is None:
+        print("no divergence in {} records".format(matched))
+    else:
+        print(divergence)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()